@@ -1,9 +1,19 @@
 from django.contrib import admin
 
-from .models import Group, Post
+from . import search
+from .models import Comment, Follow, Group, Post
+from .paginator import ApproximateCountPaginator
 
 
-class PostAdmin(admin.ModelAdmin):
+class LargeTableAdmin(admin.ModelAdmin):
+    # Без COUNT(*) по всей таблице: примерное число строк в списке и
+    # никакого второго подсчёта «всего» при поиске и фильтрации.
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+    empty_value_display = "-пусто-"
+
+
+class PostAdmin(LargeTableAdmin):
     list_display = (
         "pk",
         "text",
@@ -11,9 +21,17 @@ class PostAdmin(admin.ModelAdmin):
         "pub_date",
         "author",
     )
+    list_select_related = ("author", "group")
     search_fields = ("text",)
     list_filter = ("pub_date",)
-    empty_value_display = "-пусто-"
+    date_hierarchy = "pub_date"
+    autocomplete_fields = ("author", "group")
+
+    def get_search_results(self, request, queryset, search_term):
+        # Вместо LIKE по search_fields — тот же индекс, что у /search/.
+        if not search.terms(search_term):
+            return queryset, False
+        return queryset.filter(pk__in=search.matching(search_term)), False
 
 
 class GroupAdmin(admin.ModelAdmin):
@@ -31,5 +49,31 @@ class GroupAdmin(admin.ModelAdmin):
     empty_value_display = "-пусто-"
 
 
+class CommentAdmin(LargeTableAdmin):
+    list_display = (
+        "pk",
+        "text",
+        "post_id",
+        "author",
+        "created",
+    )
+    list_select_related = ("author",)
+    search_fields = ("text",)
+    autocomplete_fields = ("post", "author")
+
+
+class FollowAdmin(LargeTableAdmin):
+    list_display = (
+        "pk",
+        "user",
+        "author",
+    )
+    list_select_related = ("user", "author")
+    search_fields = ("user__username", "author__username")
+    autocomplete_fields = ("user", "author")
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
+admin.site.register(Comment, CommentAdmin)
+admin.site.register(Follow, FollowAdmin)
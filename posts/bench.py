@@ -0,0 +1,61 @@
+"""Вспомогательные функции для команд bench_*."""
+
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Post
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rollback():
+    """Выполняет блок в транзакции и откатывает все изменения."""
+    try:
+        with transaction.atomic():
+            yield
+            raise _Rollback
+    except _Rollback:
+        pass
+
+
+@contextmanager
+def explicit_pub_date():
+    """Позволяет bulk_create сохранить заданный pub_date."""
+    field = Post._meta.get_field("pub_date")
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def best_of(func, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def seed_posts(authors, count, group=None, batch_size=1000):
+    """Создаёт count постов с убывающими pub_date, по кругу по авторам."""
+    now = timezone.now()
+    with explicit_pub_date():
+        for start in range(0, count, batch_size):
+            Post.objects.bulk_create(
+                Post(
+                    text=f"bench post {i}",
+                    author=authors[i % len(authors)],
+                    group=group,
+                    pub_date=now - timedelta(seconds=i),
+                )
+                for i in range(start, min(start + batch_size, count))
+            )
@@ -0,0 +1,186 @@
+import hashlib
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date, parse_http_date
+
+from yatube import db
+
+GLOBAL = ("global", None)
+
+
+def group(pk):
+    return ("group", pk)
+
+
+def author(pk):
+    return ("author", pk)
+
+
+def user(pk):
+    return ("user", pk)
+
+
+def post(pk):
+    return ("post", pk)
+
+
+def _key(scope, pk):
+    if pk is None:
+        return f"generation:{scope}"
+    return f"generation:{scope}:{pk}"
+
+
+def bump(*scopes):
+    """Сменяет поколение областей: все фрагменты с ними устаревают."""
+    # Поколение помнит время смены: track() сверяет его с отставанием
+    # реплик.
+    cache.set_many(
+        {_key(*scope): f"{time.time()}:{uuid4().hex}" for scope in scopes},
+        timeout=None,
+    )
+
+
+def _generations(scopes):
+    """Текущие поколения областей, один get_many в кеш."""
+    keys = [_key(*scope) for scope in scopes]
+    values = cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        # Вытесненное поколение давно не менялось.
+        for key in missing:
+            cache.add(key, f"0:{uuid4().hex}", timeout=None)
+        values.update(cache.get_many(missing))
+    return [values.get(key, "") for key in keys]
+
+
+def _digest(generations):
+    digest = hashlib.md5()
+    for generation in generations:
+        digest.update(generation.encode())
+    return digest.hexdigest()
+
+
+def _bumped_at(generations):
+    """Время последней смены поколений; у поколений без времени — 0."""
+    times = [0.0]
+    for generation in generations:
+        stamp, separator, _ = generation.partition(":")
+        if separator:
+            times.append(float(stamp))
+    return max(times)
+
+
+def version(*scopes):
+    """Общий ключ текущих поколений областей."""
+    return _digest(_generations(scopes))
+
+
+def track(request, *scopes):
+    """
+    Запоминает, от каких областей зависит страница запроса, и возвращает
+    их текущее поколение. По ним cached_page проверяет копию страницы.
+
+    Запрос, читающий с реплики меньше REPLICA_PIN_SECONDS после смены
+    поколения, мог не увидеть изменений: его фрагменты не кешируются
+    (request.cache_fresh), иначе устаревшая копия прожила бы весь срок
+    под новым поколением.
+    """
+    generations = _generations(scopes)
+    request.cache_scopes = scopes
+    request.cache_version = _digest(generations)
+    request.cache_fresh = not (
+        db.reads_from_replica()
+        and _bumped_at(generations)
+        > time.time() - settings.REPLICA_PIN_SECONDS
+    )
+    return request.cache_version
+
+
+def fragment_context(request, *scopes):
+    version = track(request, *scopes)
+    return {
+        "cache_version": version,
+        # Тег cache с нулевым сроком не сохраняет фрагмент.
+        "cache_timeout": (
+            settings.FRAGMENT_CACHE_TIMEOUT if request.cache_fresh else 0
+        ),
+    }
+
+
+def _page_key(request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f"page:{path}"
+
+
+def is_anonymous(request):
+    """Без cookie сессии: пользователя можно не загружать из базы."""
+    return settings.SESSION_COOKIE_NAME not in request.COOKIES
+
+
+def _is_cacheable(request, response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and getattr(request, "cache_scopes", None)
+    )
+
+
+def cached_page(request, view, *args, **kwargs):
+    """
+    Отдаёт анонимному посетителю готовую страницу из кеша.
+
+    Копия действительна, пока не сменилось поколение областей, которые
+    представление отметило через track(): проверка — один get_many в
+    кеш без запросов к базе. На If-None-Match и If-Modified-Since с
+    актуальной копией отвечает 304. Новая копия рендерится из основной
+    базы: отстающая реплика не попадает в кеш под новым поколением.
+    """
+    key = _page_key(request)
+    entry = cache.get(key)
+    if entry is not None:
+        generation, scopes, modified, response = entry
+        if version(*scopes) == generation:
+            return get_conditional_response(
+                request,
+                etag=response["ETag"],
+                last_modified=modified,
+                response=response,
+            )
+
+    with db.primary_reads():
+        response = view(request, *args, **kwargs)
+    if not _is_cacheable(request, response):
+        return response
+    # Валидаторы, выставленные самим представлением, сохраняются.
+    digest = hashlib.md5(response.content).hexdigest()
+    response.setdefault("ETag", f'"{digest}"')
+    response.setdefault("Last-Modified", http_date(time.time()))
+    modified = parse_http_date(response["Last-Modified"])
+    patch_cache_control(
+        response,
+        public=True,
+        max_age=settings.PAGE_CACHE_MAX_AGE,
+        must_revalidate=True,
+    )
+    # Авторизованным по тому же адресу отдаётся другая страница.
+    patch_vary_headers(response, ["Cookie"])
+    cache.set(
+        key,
+        (request.cache_version, request.cache_scopes, modified, response),
+        settings.PAGE_CACHE_TIMEOUT,
+    )
+    return get_conditional_response(
+        request,
+        etag=response["ETag"],
+        last_modified=modified,
+        response=response,
+    )
@@ -0,0 +1,63 @@
+"""
+Условные запросы к странице поста: ETag и Last-Modified считаются одним
+запросом по индексам, без загрузки комментариев и шаблонов. Правки, не
+меняющие строк поста, — редактирование комментария, переименование
+автора — учитываются через поколения областей кеша поста и автора.
+"""
+
+import hashlib
+
+from django.db.models import OuterRef, Subquery
+
+from . import cache
+from .models import Comment, Post
+
+
+def post_state(request, username, post_id):
+    """Всё, от чего зависит страница поста, кроме текущего пользователя."""
+    if not hasattr(request, "post_state"):
+        # Подзапрос, а не Max() с GROUP BY: последний комментарий берётся
+        # с конца индекса (post, created).
+        last_comment = (
+            Comment.objects.filter(post=OuterRef("pk"))
+            .order_by("-created")
+            .values("created")[:1]
+        )
+        rows = (
+            Post.objects.filter(pk=post_id, author__username=username)
+            .annotate(last_comment=Subquery(last_comment))
+            .values_list(
+                "updated",
+                "last_comment",
+                "comment_count",
+                "author__stats__post_count",
+                "author__stats__follower_count",
+                "author__stats__following_count",
+                "author_id",
+            )
+            # Строка не больше одной, сортировать нечего.
+            .order_by()[:1]
+        )
+        request.post_state = rows[0] if rows else None
+    return request.post_state
+
+
+def post_etag(request, username, post_id):
+    state = post_state(request, username, post_id)
+    if state is None:
+        return None
+    generation = cache.version(cache.author(state[-1]), cache.post(post_id))
+    # Страница содержит ссылку «Редактировать» и форму комментария,
+    # которые зависят от пользователя; CSRF-токен меняется при входе.
+    token = f"{state}|{generation}|{request.user.pk}"
+    return hashlib.md5(token.encode()).hexdigest()
+
+
+def post_last_modified(request, username, post_id):
+    state = post_state(request, username, post_id)
+    if state is None:
+        return None
+    updated, last_comment = state[:2]
+    if last_comment is None:
+        return updated
+    return max(updated, last_comment)
@@ -0,0 +1,52 @@
+from functools import wraps
+
+from yatube.db import replica_reads
+
+from . import cache
+
+
+def query_budget(queries):
+    """
+    Объявляет, сколько SQL-запросов может выполнить представление.
+
+    Бюджет не зависит от числа постов и комментариев на странице и
+    проверяется тестами на заполненной базе; запросы сессии и
+    пользователя в него не входят.
+    """
+
+    def decorator(view):
+        view.query_budget = queries
+        return view
+
+    return decorator
+
+
+def cache_anonymous_page(view):
+    """
+    Кеширует страницу целиком для посетителей без сессии.
+
+    Представление должно отметить, от каких областей кеша зависит
+    страница, через cache.track() или cache.fragment_context().
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method in ("GET", "HEAD") and cache.is_anonymous(request):
+            return cache.cached_page(request, view, *args, **kwargs)
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def read_from_replica(view):
+    """
+    Разрешает представлению читать с реплик базы; после записи в том же
+    запросе или недавней записи клиента чтение идёт из основной базы.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with replica_reads():
+            return view(request, *args, **kwargs)
+
+    return wrapper
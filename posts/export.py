@@ -0,0 +1,109 @@
+"""
+Потоковая выгрузка постов и комментариев автора.
+
+Строки читаются из базы кусками через iterator() и сразу превращаются в
+строки файла, так что память не зависит от числа записей. Формат
+записей тот же, что читает import_content; группы постов идут первыми,
+чтобы файл загружался и в пустую базу.
+"""
+
+import csv
+import json
+
+from .models import Comment, Group, Post
+
+COLUMNS = (
+    "type",
+    "id",
+    "author",
+    "text",
+    "group",
+    "pub_date",
+    "image",
+    "post",
+    "created",
+    "slug",
+    "title",
+    "description",
+)
+CONTENT_TYPES = {
+    "jsonl": "application/x-ndjson; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def records(author, chunk_size=1000):
+    """
+    Записи о группах постов автора, затем о его постах и комментариях,
+    в порядке id.
+    """
+    groups = (
+        Group.objects.filter(
+            pk__in=Post.objects.filter(author=author).values("group")
+        )
+        .order_by("pk")
+        .values_list("slug", "title", "description")
+    )
+    for slug, title, description in groups.iterator(chunk_size):
+        yield {
+            "type": "group",
+            "slug": slug,
+            "title": title,
+            "description": description,
+        }
+    posts = (
+        Post.objects.filter(author=author)
+        .order_by("pk")
+        .values_list("pk", "text", "group__slug", "pub_date", "image")
+    )
+    for pk, text, group, pub_date, image in posts.iterator(chunk_size):
+        yield {
+            "type": "post",
+            "id": pk,
+            "author": author.username,
+            "text": text,
+            "group": group,
+            "pub_date": pub_date.isoformat(),
+            "image": image or None,
+        }
+    comments = (
+        Comment.objects.filter(author=author)
+        .order_by("pk")
+        .values_list("pk", "post_id", "text", "created")
+    )
+    for pk, post_id, text, created in comments.iterator(chunk_size):
+        yield {
+            "type": "comment",
+            "id": pk,
+            "author": author.username,
+            "text": text,
+            "post": post_id,
+            "created": created.isoformat(),
+        }
+
+
+class _Line:
+    """Файл для csv.writer, который возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        record = {
+            key: value for key, value in row.items() if value is not None
+        }
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def csv_lines(rows):
+    writer = csv.DictWriter(_Line(), COLUMNS)
+    yield writer.writerow(dict(zip(COLUMNS, COLUMNS)))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def lines(author, file_format, chunk_size=1000):
+    serialize = csv_lines if file_format == "csv" else jsonl_lines
+    return serialize(records(author, chunk_size))
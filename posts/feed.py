@@ -0,0 +1,250 @@
+import itertools
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from . import cache
+from .models import FeedEntry, Follow, Post, UserStats
+from .paginator import CursorPaginator, MergedCursorPaginator
+
+BATCH_SIZE = 1000
+
+
+def feed_depth():
+    return settings.FEED_DEPTH
+
+
+def pull_threshold():
+    return settings.FEED_PULL_THRESHOLD
+
+
+def is_pulled(author_id):
+    """Посты авторов с числом подписчиков выше порога не рассылаются."""
+    threshold = pull_threshold()
+    if threshold is None:
+        return False
+    return UserStats.objects.filter(
+        user_id=author_id, follower_count__gt=threshold
+    ).exists()
+
+
+def _entries(user_id, posts):
+    return [
+        FeedEntry(
+            user_id=user_id,
+            post=post,
+            author_id=post.author_id,
+            pub_date=post.pub_date,
+        )
+        for post in posts
+    ]
+
+
+def _bump_users(user_ids):
+    scopes = [cache.user(user_id) for user_id in user_ids]
+    if scopes:
+        cache.bump(*scopes)
+
+
+def _trim_sample(user_ids):
+    """
+    Обрезает случайную долю FEED_TRIM_SAMPLE лент: каждая вставка
+    удлиняет ленту на строку, и без обрезки она растёт без предела.
+    """
+    rate = settings.FEED_TRIM_SAMPLE
+    for user_id in user_ids:
+        if random.random() < rate:
+            trim(user_id)
+
+
+def _deliver(entries):
+    FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    user_ids = [entry.user_id for entry in entries]
+    _trim_sample(user_ids)
+    _bump_users(user_ids)
+
+
+def fan_out(post):
+    """
+    Раскладывает новый пост по лентам подписчиков автора, сбрасывает
+    кеш этих лент и время от времени обрезает их до FEED_DEPTH.
+    """
+    if is_pulled(post.author_id):
+        return
+    follower_ids = Follow.objects.filter(author_id=post.author_id).values_list(
+        "user_id", flat=True
+    )
+    batch = []
+    for user_id in follower_ids.iterator():
+        batch.extend(_entries(user_id, [post]))
+        if len(batch) >= BATCH_SIZE:
+            _deliver(batch)
+            batch = []
+    _deliver(batch)
+
+
+def bump_followers(author_id):
+    """
+    Сбрасывает кеш лент, в которые разложены посты автора, — после
+    правки или удаления поста. Ленты с постами авторов выше порога
+    зависят от области самого автора.
+    """
+    if is_pulled(author_id):
+        return
+    follower_ids = Follow.objects.filter(author_id=author_id).values_list(
+        "user_id", flat=True
+    )
+    batch = []
+    for user_id in follower_ids.iterator():
+        batch.append(user_id)
+        if len(batch) >= BATCH_SIZE:
+            _bump_users(batch)
+            batch = []
+    _bump_users(batch)
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние посты автора после подписки."""
+    if is_pulled(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).only(
+        "pk", "author_id", "pub_date"
+    )[: feed_depth()]
+    FeedEntry.objects.bulk_create(
+        _entries(user_id, posts), ignore_conflicts=True
+    )
+    trim(user_id)
+
+
+def resume_push(author_id):
+    """
+    Раскладывает по лентам подписчиков посты автора, вышедшие, пока
+    лента читала их при открытии, когда после отписки подписчиков стало
+    ровно FEED_PULL_THRESHOLD: иначе эти посты пропали бы из лент.
+    Рассылаются только посты новее последнего разложенного.
+    """
+    threshold = pull_threshold()
+    if (
+        threshold is None
+        or not UserStats.objects.filter(
+            user_id=author_id, follower_count=threshold
+        ).exists()
+    ):
+        return
+    posts = (
+        Post.objects.filter(author_id=author_id)
+        .annotate(pushed=Exists(FeedEntry.objects.filter(post=OuterRef("pk"))))
+        .order_by("-pub_date", "-pk")
+        .only("pk", "author_id", "pub_date")
+    )
+    missing = list(
+        itertools.takewhile(
+            lambda post: not post.pushed, posts[: feed_depth()]
+        )
+    )
+    if not missing:
+        return
+    follower_ids = Follow.objects.filter(author_id=author_id).values_list(
+        "user_id", flat=True
+    )
+    batch = []
+    for user_id in follower_ids.iterator():
+        batch.extend(_entries(user_id, missing))
+        if len(batch) >= BATCH_SIZE:
+            _deliver(batch)
+            batch = []
+    _deliver(batch)
+
+
+def prune(user_id, author_id):
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def trim(user_id, depth=None):
+    """Оставляет в ленте пользователя не больше depth последних записей."""
+    depth = feed_depth() if depth is None else depth
+    entries = FeedEntry.objects.filter(user_id=user_id).order_by(
+        "-pub_date", "-post_id"
+    )
+    boundary = entries.values_list("pub_date", "post_id")[depth : depth + 1]
+    if not boundary:
+        return
+    pub_date, post_id = boundary[0]
+    entries.filter(pub_date__lte=pub_date).exclude(
+        pub_date=pub_date, post_id__gt=post_id
+    ).delete()
+
+
+@transaction.atomic
+def rebuild(user_id):
+    FeedEntry.objects.filter(user_id=user_id).delete()
+    author_ids = Follow.objects.filter(user_id=user_id).values_list(
+        "author_id", flat=True
+    )
+    for author_id in author_ids:
+        backfill(user_id, author_id)
+
+
+def pulled_authors(user, author_ids=None):
+    threshold = pull_threshold()
+    if threshold is None:
+        return []
+    # Подписки читателя — подзапрос: их немного, СУБД идёт от них к
+    # статистике по первичному ключу, и план не зависит от того, сколько
+    # подписчиков у популярных авторов.
+    if author_ids is None:
+        author_ids = Follow.objects.filter(user=user).values("author_id")
+    elif not author_ids:
+        return []
+    return list(
+        UserStats.objects.filter(
+            user_id__in=author_ids, follower_count__gt=threshold
+        ).values_list("user_id", flat=True)
+    )
+
+
+class PulledPosts(CursorPaginator):
+    """Посты авторов, читаемых при открытии ленты, в виде FeedEntry."""
+
+    def __init__(self, user, author_ids, per_page):
+        super().__init__(
+            Post.objects.filter(author_id__in=author_ids).select_related(
+                "author"
+            ),
+            per_page,
+        )
+        self.user = user
+
+    def fetch(self, direction, position=None, limit=None):
+        posts = super().fetch(direction, position, limit)
+        return _entries(self.user.pk, posts)
+
+
+def timeline(user, author_ids=None, per_page=10, pulled=None):
+    """
+    Лента подписок пользователя.
+
+    Посты обычных авторов читаются из материализованной ленты, посты
+    авторов выше FEED_PULL_THRESHOLD подтягиваются при чтении одним
+    запросом и сливаются с ней по (pub_date, post_id). author_ids — уже
+    известный список авторов, на которых подписан пользователь, pulled —
+    уже известный результат pulled_authors.
+    """
+    if pulled is None:
+        pulled = pulled_authors(user, author_ids)
+    pushed = CursorPaginator(
+        FeedEntry.objects.filter(user=user)
+        .exclude(author_id__in=pulled)
+        .select_related("post__author"),
+        per_page,
+        tiebreak="post_id",
+    )
+    if not pulled:
+        return pushed
+    return MergedCursorPaginator(
+        [pushed, PulledPosts(user, pulled, per_page)],
+        per_page,
+        tiebreak="post_id",
+    )
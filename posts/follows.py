@@ -0,0 +1,26 @@
+"""
+Граф подписок: подписан ли читатель на авторов из выборки.
+
+Признак считается подзапросом по уникальному индексу (user, author);
+обратный индекс (author, user) обслуживает выборки подписчиков автора.
+"""
+
+from django.db.models import BooleanField, Exists, OuterRef, Value
+
+from .models import Follow
+
+
+def with_following(users, user):
+    """
+    Добавляет к запросу пользователей признак is_followed — подписан ли
+    на них user, — подзапросом в том же SQL.
+    """
+    if user.is_anonymous:
+        return users.annotate(
+            is_followed=Value(False, output_field=BooleanField())
+        )
+    return users.annotate(
+        is_followed=Exists(
+            Follow.objects.filter(user=user, author=OuterRef("pk"))
+        )
+    )
@@ -1,5 +1,7 @@
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import ModelForm
 
+from .images import prepare_image
 from .models import Comment, Post
 
 
@@ -14,6 +16,13 @@ class PostForm(ModelForm):
             "image": "В формате jpg, jpeg, png",
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get("image")
+        # Уже сохранённая картинка поста не обрабатывается повторно.
+        if isinstance(image, UploadedFile):
+            return prepare_image(image)
+        return image
+
 
 class CommentForm(ModelForm):
     class Meta:
@@ -0,0 +1,68 @@
+"""
+Подготовка загруженных изображений постов до сохранения.
+
+Размер в пикселях проверяется по заголовку, до декодирования. JPEG
+декодируется сразу в уменьшенном масштабе, поэтому фотография с камеры
+не разворачивается в памяти целиком; остальные форматы ограничены
+POST_IMAGE_MAX_PIXELS.
+"""
+
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+
+
+def prepare_image(upload):
+    """
+    Поворачивает изображение по EXIF, уменьшает до POST_IMAGE_MASTER_SIZE
+    по длинной стороне и пересохраняет без метаданных.
+    """
+    upload.seek(0)
+    try:
+        image = Image.open(upload)
+        buffer, extension, content_type = _reencode(image)
+    except (OSError, SyntaxError, Image.DecompressionBombError):
+        # Обрезанный или испорченный файл Pillow замечает только при
+        # декодировании, уже после проверки ImageField.
+        raise ValidationError(
+            "Не удалось прочитать изображение.", code="invalid_image"
+        )
+    name = os.path.splitext(os.path.basename(upload.name))[0]
+    return SimpleUploadedFile(
+        f"{name}.{extension}", buffer.getvalue(), content_type
+    )
+
+
+def _reencode(image):
+    width, height = image.size
+    max_pixels = settings.POST_IMAGE_MAX_PIXELS
+    if width * height > max_pixels:
+        raise ValidationError(
+            f"Изображение больше {max_pixels / 10 ** 6:g} Мп.",
+            code="too_many_pixels",
+        )
+    master = settings.POST_IMAGE_MASTER_SIZE
+    image.draft("RGB", (master, master))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((master, master), Image.LANCZOS)
+
+    buffer = BytesIO()
+    if image.mode in ("RGBA", "LA", "P") and (
+        image.mode != "P" or "transparency" in image.info
+    ):
+        image.convert("RGBA").save(buffer, "PNG", optimize=True)
+        extension, content_type = "png", "image/png"
+    else:
+        image.convert("RGB").save(
+            buffer,
+            "JPEG",
+            quality=settings.POST_IMAGE_QUALITY,
+            optimize=True,
+            progressive=True,
+        )
+        extension, content_type = "jpg", "image/jpeg"
+    return buffer, extension, content_type
@@ -0,0 +1,114 @@
+import functools
+from contextlib import ExitStack
+from io import StringIO
+from unittest import mock
+
+from django.contrib import admin
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from posts.bench import best_of, rollback, seed_posts
+from posts.models import Comment, Group, Post, User
+from posts.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает время страниц админки постов до и после оптимизаций "
+        "на большой базе. Данные создаются во временной транзакции."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000)
+        parser.add_argument("--groups", type=int, default=200)
+        parser.add_argument("--posts", type=int, default=200000)
+        parser.add_argument("--comments", type=int, default=100000)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        with rollback(), override_settings(ALLOWED_HOSTS=["*"]):
+            self.seed(options)
+            client = Client()
+            client.force_login(
+                User.objects.create_superuser("bench_admin", "", "bench")
+            )
+            urls = {
+                "changelist": reverse("admin:posts_post_changelist"),
+                "search": reverse("admin:posts_post_changelist") + "?q=17",
+                "add form": reverse("admin:posts_post_add"),
+                "comments": reverse("admin:posts_comment_changelist"),
+            }
+            self.stdout.write(
+                f"{'page':>10} {'mode':>7} {'ms':>9} {'queries':>8} "
+                f"{'KB':>8}"
+            )
+            for name, url in urls.items():
+                with self.stock_admin():
+                    self.measure(client, name, "before", url, options)
+                self.measure(client, name, "after", url, options)
+
+    def seed(self, options):
+        User.objects.bulk_create(
+            User(username=f"bench_user_{i}") for i in range(options["users"])
+        )
+        users = list(User.objects.filter(username__startswith="bench_user_"))
+        Group.objects.bulk_create(
+            Group(title=f"group {i}", slug=f"bench-group-{i}")
+            for i in range(options["groups"])
+        )
+        groups = list(Group.objects.filter(slug__startswith="bench-group-"))
+        for index in range(len(groups)):
+            share = options["posts"] // len(groups)
+            seed_posts(users, share, group=groups[index])
+        post_ids = list(Post.objects.values_list("pk", flat=True)[:1000])
+        for start in range(0, options["comments"], 1000):
+            Comment.objects.bulk_create(
+                Comment(
+                    post_id=post_ids[i % len(post_ids)],
+                    author=users[i % len(users)],
+                    text=f"bench comment {i}",
+                )
+                for i in range(start, min(start + 1000, options["comments"]))
+            )
+        rebuild_stats([user.pk for user in users])
+        call_command("rebuild_search_index", stdout=StringIO())
+
+    def stock_admin(self):
+        """Настройки админок постов и комментариев до оптимизаций."""
+        stack = ExitStack()
+        for model in (Post, Comment):
+            model_admin = admin.site._registry[model]
+            stack.enter_context(
+                mock.patch.multiple(
+                    model_admin,
+                    list_select_related=False,
+                    paginator=Paginator,
+                    show_full_result_count=True,
+                    autocomplete_fields=(),
+                    date_hierarchy=None,
+                    get_search_results=functools.partial(
+                        admin.ModelAdmin.get_search_results, model_admin
+                    ),
+                )
+            )
+        return stack
+
+    def measure(self, client, name, mode, url, options):
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            response = client.get(url)
+        elapsed = best_of(lambda: client.get(url), options["repeat"])
+        self.stdout.write(
+            f"{name:>10} {mode:>7} {elapsed * 1000:>9.1f} "
+            f"{len(queries):>8} {len(response.content) / 1024:>8.0f}"
+        )
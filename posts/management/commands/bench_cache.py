@@ -0,0 +1,95 @@
+import multiprocessing
+import os
+import tempfile
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from posts.bench import best_of
+from yatube.sqlite_cache import SQLiteCache
+
+
+def hit_ratio(backend, keys, ready, queue):
+    """Доля ключей, которые видит другой процесс (другой воркер)."""
+    ready.wait()
+    found = backend.get_many(keys)
+    queue.put(len(found) / len(keys))
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает LocMemCache и SQLiteCache: скорость get/set/get_many "
+        "и долю попаданий у воркера, не писавшего в кеш."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keys", type=int, default=1000)
+        parser.add_argument("--batch", type=int, default=10)
+        parser.add_argument("--size", type=int, default=2000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--workers", type=int, default=4)
+
+    def handle(self, *args, **options):
+        params = {"OPTIONS": {"MAX_ENTRIES": options["keys"] * 2}}
+        with tempfile.TemporaryDirectory() as directory:
+            backends = {
+                "locmem": LocMemCache("bench", params),
+                "sqlite": SQLiteCache(
+                    os.path.join(directory, "cache.sqlite3"), params
+                ),
+            }
+            self.stdout.write(
+                f"{'backend':>8} {'set/s':>10} {'get/s':>10} "
+                f"{'get_many/s':>12} {'shared hits':>12}"
+            )
+            for name, backend in backends.items():
+                self.stdout.write(self.run(name, backend, options))
+
+    def run(self, name, backend, options):
+        count = options["keys"]
+        keys = [f"bench:{i}" for i in range(count)]
+        value = "x" * options["size"]
+        batches = [
+            keys[start : start + options["batch"]]
+            for start in range(0, count, options["batch"])
+        ]
+        repeat = options["repeat"]
+
+        # Воркеры стартуют до заполнения кеша, как процессы gunicorn.
+        context = multiprocessing.get_context("fork")
+        ready = context.Event()
+        queue = context.Queue()
+        workers = [
+            context.Process(
+                target=hit_ratio, args=(backend, keys, ready, queue)
+            )
+            for _ in range(options["workers"])
+        ]
+        for worker in workers:
+            worker.start()
+
+        def set_all():
+            for key in keys:
+                backend.set(key, value)
+
+        def get_all():
+            for key in keys:
+                backend.get(key)
+
+        def get_batches():
+            for batch in batches:
+                backend.get_many(batch)
+
+        set_time = best_of(set_all, repeat)
+        get_time = best_of(get_all, repeat)
+        many_time = best_of(get_batches, repeat)
+        ready.set()
+        ratios = [queue.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        shared = sum(ratios) / len(ratios)
+        backend.clear()
+        return (
+            f"{name:>8} {count / set_time:>10.0f} {count / get_time:>10.0f} "
+            f"{len(batches) / many_time:>12.0f} {shared:>12.0%}"
+        )
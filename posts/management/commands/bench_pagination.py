@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+
+from posts.bench import best_of, rollback, seed_posts
+from posts.models import Post, User
+from posts.paginator import NEXT, CursorPaginator, encode_cursor
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает время открытия глубоких страниц ленты: OFFSET-пагинация "
+        "против курсорной. Данные создаются во временной транзакции."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=100000)
+        parser.add_argument("--per-page", type=int, default=10)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--pages",
+            type=int,
+            nargs="+",
+            default=[1, 10, 100, 1000, 5000, 9999],
+        )
+
+    def handle(self, *args, **options):
+        per_page = options["per_page"]
+        with rollback():
+            author = User.objects.create(username="bench_pagination")
+            seed_posts([author], options["posts"])
+            posts = Post.objects.all()
+            ids = list(
+                posts.order_by("-pub_date", "-pk").values_list("pk", flat=True)
+            )
+            self.stdout.write(
+                f"{'page':>8} {'offset, ms':>12} {'cursor, ms':>12}"
+            )
+            for number in options["pages"]:
+                if (number - 1) * per_page >= len(ids):
+                    continue
+                offset = best_of(
+                    lambda: list(Paginator(posts, per_page).page(number)),
+                    options["repeat"],
+                )
+                cursor = None
+                if number > 1:
+                    last = posts.get(pk=ids[(number - 1) * per_page - 1])
+                    cursor = encode_cursor(NEXT, last)
+                keyset = best_of(
+                    lambda: list(
+                        CursorPaginator(posts, per_page).page(cursor)
+                    ),
+                    options["repeat"],
+                )
+                self.stdout.write(
+                    f"{number:>8} {offset * 1000:>12.2f} {keyset * 1000:>12.2f}"
+                )
@@ -0,0 +1,122 @@
+import os
+import statistics
+import tempfile
+import threading
+import time
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from posts.models import Post, User
+
+PROFILES = {
+    "stock": {"ENGINE": "django.db.backends.sqlite3", "OPTIONS": {}},
+    "tuned": {
+        "ENGINE": "yatube.sqlite3",
+        "OPTIONS": {
+            "PRAGMAS": settings.SQLITE_PRAGMAS,
+            "TRANSACTION_MODE": "IMMEDIATE",
+        },
+    },
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает обычный SQLite и профиль SQLITE_PRODUCTION под "
+        "конкурентной записью: потоки одновременно публикуют посты и "
+        "комментарии через new_post и add_comment. Каждый профиль "
+        "работает со своей временной базой."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=8)
+        parser.add_argument("--requests", type=int, default=50)
+
+    def handle(self, *args, **options):
+        if connections[DEFAULT_DB_ALIAS].vendor != "sqlite":
+            raise CommandError("Бенчмарк работает только с SQLite.")
+        original = connections.databases[DEFAULT_DB_ALIAS]
+        self.stdout.write(
+            f"{'profile':>8} {'req/s':>8} {'p50, ms':>9} {'p95, ms':>9} "
+            f"{'locked':>7}"
+        )
+        try:
+            for name, profile in PROFILES.items():
+                with tempfile.TemporaryDirectory() as directory:
+                    self.use_database(
+                        {
+                            **original,
+                            **profile,
+                            "NAME": os.path.join(directory, "db.sqlite3"),
+                        }
+                    )
+                    call_command("migrate", verbosity=0, stdout=StringIO())
+                    self.stdout.write(self.run(name, options))
+                    connections[DEFAULT_DB_ALIAS].close()
+        finally:
+            self.use_database(original)
+
+    def use_database(self, settings_dict):
+        connections[DEFAULT_DB_ALIAS].close()
+        connections.databases[DEFAULT_DB_ALIAS] = settings_dict
+        # Соединение главного потока создастся заново с новыми настройками,
+        # потоки-писатели получат свои.
+        del connections[DEFAULT_DB_ALIAS]
+
+    def run(self, name, options):
+        writers = [
+            User.objects.create_user(username=f"bench_writer_{i}")
+            for i in range(options["writers"])
+        ]
+        post = Post.objects.create(text="bench", author=writers[0])
+        comment_url = reverse(
+            "add_comment",
+            kwargs={"username": writers[0].username, "post_id": post.pk},
+        )
+        start = threading.Barrier(len(writers))
+        timings = []
+        locked = []
+
+        def write(user):
+            client = Client()
+            client.force_login(user)
+            start.wait()
+            for i in range(options["requests"]):
+                url, data = (
+                    (reverse("new_post"), {"text": f"post {i}"})
+                    if i % 2 == 0
+                    else (comment_url, {"text": f"comment {i}"})
+                )
+                begin = time.perf_counter()
+                try:
+                    client.post(url, data)
+                except OperationalError:
+                    locked.append(url)
+                timings.append(time.perf_counter() - begin)
+            connections[DEFAULT_DB_ALIAS].close()
+
+        with override_settings(ALLOWED_HOSTS=["*"], THUMBNAIL_WORKERS=0):
+            threads = [
+                threading.Thread(target=write, args=(user,))
+                for user in writers
+            ]
+            begin = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - begin
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        return (
+            f"{name:>8} {len(timings) / elapsed:>8.0f} "
+            f"{statistics.median(timings) * 1000:>9.1f} "
+            f"{p95 * 1000:>9.1f} {len(locked):>7}"
+        )
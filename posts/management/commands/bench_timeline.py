@@ -0,0 +1,89 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from posts import feed
+from posts.bench import best_of, rollback, seed_posts
+from posts.models import FeedEntry, Follow, Post, User
+from posts.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает стоимость записи и чтения ленты подписок в режимах "
+        "push и push/pull на графе подписок с перекосом. Данные создаются "
+        "во временной транзакции."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000)
+        parser.add_argument("--authors", type=int, default=50)
+        parser.add_argument("--stars", type=int, default=2)
+        parser.add_argument("--follows", type=int, default=10)
+        parser.add_argument("--posts", type=int, default=20)
+        parser.add_argument("--threshold", type=int, default=500)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'mode':>8} {'star post, ms':>14} {'entries':>8} "
+            f"{'author post, ms':>16} {'read, ms':>9} {'cursor, ms':>11}"
+        )
+        for mode, threshold in (
+            ("push", None),
+            ("hybrid", options["threshold"]),
+        ):
+            with rollback(), override_settings(FEED_PULL_THRESHOLD=threshold):
+                self.run(mode, options)
+
+    def seed(self, options):
+        rng = random.Random(0)
+        User.objects.bulk_create(
+            User(username=f"bench_user_{i}") for i in range(options["users"])
+        )
+        users = list(User.objects.filter(username__startswith="bench_user_"))
+        stars = users[: options["stars"]]
+        authors = users[: options["stars"] + options["authors"]]
+        readers = users[len(authors) :]
+        follows = []
+        for reader in readers:
+            follows.extend(Follow(user=reader, author=star) for star in stars)
+            follows.extend(
+                Follow(user=reader, author=author)
+                for author in rng.sample(
+                    authors[len(stars) :], options["follows"]
+                )
+            )
+        Follow.objects.bulk_create(follows)
+        seed_posts(authors, options["posts"] * len(authors))
+        rebuild_stats([user.pk for user in users])
+        for reader in readers:
+            feed.rebuild(reader.pk)
+        return stars[0], authors[-1], readers[0]
+
+    def run(self, mode, options):
+        star, author, reader = self.seed(options)
+        entries = FeedEntry.objects.count()
+        star_write = best_of(
+            lambda: Post.objects.create(text="star", author=star),
+            options["repeat"],
+        )
+        entries = (FeedEntry.objects.count() - entries) // options["repeat"]
+        author_write = best_of(
+            lambda: Post.objects.create(text="author", author=author),
+            options["repeat"],
+        )
+        read = best_of(
+            lambda: list(feed.timeline(reader).get_page()), options["repeat"]
+        )
+        cursor = feed.timeline(reader).get_page().next_cursor
+        deep = best_of(
+            lambda: list(feed.timeline(reader).get_page(cursor)),
+            options["repeat"],
+        )
+        self.stdout.write(
+            f"{mode:>8} {star_write * 1000:>14.2f} {entries:>8} "
+            f"{author_write * 1000:>16.2f} {read * 1000:>9.2f} "
+            f"{deep * 1000:>11.2f}"
+        )
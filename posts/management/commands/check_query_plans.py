@@ -0,0 +1,182 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from posts.bench import rollback
+from posts.models import Comment, FeedEntry, Follow, Group, Post, User
+from posts.paginator import NEXT, PREVIOUS, encode_cursor
+
+# Строки плана, которые означают чтение всей таблицы или сортировку
+# строк без индекса. SCAN в SQLite — проход без условия поиска, в том
+# числе по покрывающему индексу, как у COUNT(*); поиск по индексу план
+# называет SEARCH, совпадение FTS — VIRTUAL TABLE INDEX n:Mn.
+PROBLEMS = {
+    "sqlite": (
+        re.compile(
+            r"^SCAN (?P<table>\w+)\b(?: AS \w+\b)?"
+            r"(?P<ordered> USING (?:COVERING )?INDEX \w+)?"
+            r"(?! VIRTUAL TABLE INDEX \d+:\S*M\d)"
+        ),
+        re.compile(r"USE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY"),
+    ),
+    "postgresql": (
+        re.compile(r"Seq Scan on (?P<table>\w+)"),
+        re.compile(r"\bSort\b"),
+    ),
+}
+LIMIT = re.compile(r"\bLIMIT\b", re.IGNORECASE)
+
+# Известные исключения: справочник групп выводится в форме поста целиком,
+# а совпадения поиска сортируются по релевантности, которой нет в индексе.
+ALLOWED_SCANS = {"posts_group"}
+ALLOWED_SORTS = {"search"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Выполняет EXPLAIN для каждого SQL-запроса страниц сайта и "
+        "завершается с ошибкой, если запрос читает таблицу целиком или "
+        "сортирует строки без индекса. Данные создаются во временной "
+        "транзакции, кеш на время проверки отключён."
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in PROBLEMS:
+            raise CommandError(
+                f"EXPLAIN для {connection.vendor} не поддерживается."
+            )
+        self.tables = set(connection.introspection.table_names())
+        failures = 0
+        with rollback(), override_settings(
+            ALLOWED_HOSTS=["*"],
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.dummy.DummyCache"
+                }
+            },
+        ):
+            if connection.vendor == "postgresql":
+                # На маленькой таблице планировщик и так выберет Seq Scan;
+                # проверяем, что запрос вообще может идти по индексу.
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+            client = Client()
+            for name, url in self.seed(client):
+                for sql, params in self.capture(client, url):
+                    problems = self.problems(
+                        sql, params, allow_sort=name in ALLOWED_SORTS
+                    )
+                    if problems:
+                        failures += 1
+                        self.stdout.write(f"{name}: {sql}")
+                        for problem in problems:
+                            self.stdout.write(f"    {problem}")
+                self.stdout.write(f"{name}: проверено")
+        if failures:
+            raise CommandError(f"Запросов с плохим планом: {failures}")
+        self.stdout.write("Все запросы идут по индексам.")
+
+    def seed(self, client):
+        """
+        Создаёт по одной записи каждого вида и возвращает страницы,
+        в том числе продолжения лент по курсору в обе стороны.
+        """
+        author = User.objects.create_user(username="check_plans_author")
+        reader = User.objects.create_user(username="check_plans_reader")
+        group = Group.objects.create(
+            title="group", slug="check-plans-group", description="group"
+        )
+        post = Post.objects.create(text="text", author=author, group=group)
+        comment = Comment.objects.create(post=post, author=reader, text="text")
+        Follow.objects.create(user=reader, author=author)
+        Follow.objects.create(user=author, author=reader)
+        Post.objects.create(text="text", author=reader)
+        entry = FeedEntry.objects.filter(user=author).first()
+        client.force_login(author)
+        kwargs = {"username": author.username, "post_id": post.pk}
+        pages = [
+            ("index", reverse("index")),
+            ("group_posts", reverse("group_posts", args=[group.slug])),
+            ("profile", reverse("profile", args=[reader.username])),
+            ("post_view", reverse("post_view", kwargs=kwargs)),
+            ("post_comments", reverse("post_comments", kwargs=kwargs)),
+            ("add_comment", reverse("add_comment", kwargs=kwargs)),
+            ("post_edit", reverse("post_edit", kwargs=kwargs)),
+            ("follow_index", reverse("follow_index")),
+            ("search", reverse("search") + "?q=text"),
+        ]
+        cursors = [
+            ("index", reverse("index"), post, {}),
+            (
+                "group_posts",
+                reverse("group_posts", args=[group.slug]),
+                post,
+                {},
+            ),
+            ("profile", reverse("profile", args=[author.username]), post, {}),
+            (
+                "follow_index",
+                reverse("follow_index"),
+                entry,
+                {"tiebreak": "post_id"},
+            ),
+            (
+                "post_comments",
+                reverse("post_comments", kwargs=kwargs),
+                comment,
+                {"key": "created"},
+            ),
+        ]
+        for name, url, obj, fields in cursors:
+            for direction in (NEXT, PREVIOUS):
+                cursor = encode_cursor(direction, obj, **fields)
+                pages.append(
+                    (f"{name} ({direction})", f"{url}?cursor={cursor}")
+                )
+        return pages
+
+    def capture(self, client, url):
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            if not many and sql.lstrip().upper().startswith("SELECT"):
+                queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f"{url}: ответ {response.status_code}")
+        return queries
+
+    def problems(self, sql, params, allow_sort=False):
+        prefix = (
+            "EXPLAIN QUERY PLAN "
+            if connection.vendor == "sqlite"
+            else "EXPLAIN "
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            lines = [row[-1] for row in cursor.fetchall()]
+        problems = []
+        for line in lines:
+            for pattern in PROBLEMS[connection.vendor]:
+                match = pattern.search(line.strip())
+                if not match:
+                    continue
+                table = match.groupdict().get("table")
+                if match.groupdict().get("ordered") and LIMIT.search(sql):
+                    # Проход по индексу в порядке ORDER BY, который
+                    # останавливается на LIMIT, — так читается лента.
+                    continue
+                if table is None:
+                    if not allow_sort:
+                        problems.append(line.strip())
+                # Подзапросы и CTE тоже «сканируются», но это не таблицы.
+                elif table in self.tables and table not in ALLOWED_SCANS:
+                    problems.append(line.strip())
+        return problems
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Выгружает посты и комментарии автора в JSON Lines или CSV, "
+        "потоком, в файл или на стандартный вывод."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument(
+            "--format", choices=tuple(export.CONTENT_TYPES), default="jsonl"
+        )
+        parser.add_argument("--output", help="Файл; по умолчанию stdout.")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"Нет пользователя {options['username']!r}.")
+        lines = export.lines(author, options["format"], options["chunk_size"])
+        if options["output"]:
+            with open(
+                options["output"], "w", encoding="utf-8", newline=""
+            ) as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Нарезает миниатюры постов, для которых их ещё нет: после "
+        "перезапуска воркеров с задачами в очереди или смены размеров."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=100)
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Нарезать заново миниатюры всех постов с изображениями.",
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image="").exclude(image=None)
+        if not options["all"]:
+            posts = posts.filter(thumbnails="")
+        last_pk = 0
+        total = 0
+        while True:
+            post_ids = list(
+                posts.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", flat=True)[: options["chunk_size"]]
+            )
+            if not post_ids:
+                break
+            for post_id in post_ids:
+                thumbnails.generate(post_id)
+            total += len(post_ids)
+            last_pk = post_ids[-1]
+        self.stdout.write(f"Обработано постов: {total}")
@@ -0,0 +1,355 @@
+import csv
+import json
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts.models import Comment, Follow, Group, Post, User
+
+# Порядок записи пачки: группы и посты раньше ссылающихся на них строк.
+KINDS = ("group", "post", "comment", "follow")
+# Ограничение числа параметров в одном запросе ... WHERE x IN (...).
+LOOKUP_CHUNK = 500
+# Производные данные, которые сигналы не обновили при bulk_create.
+REBUILD_COMMANDS = (
+    "rebuild_user_stats",
+    "reconcile_comment_counts",
+    "rebuild_follow_feeds",
+    "rebuild_search_index",
+    "compute_suggestions",
+    "generate_thumbnails",
+)
+
+
+@contextmanager
+def explicit_dates():
+    """Позволяет bulk_create сохранить даты из файла."""
+    fields = [
+        (Post._meta.get_field("pub_date"), "auto_now_add"),
+        (Post._meta.get_field("updated"), "auto_now"),
+        (Comment._meta.get_field("created"), "auto_now_add"),
+    ]
+    for field, attr in fields:
+        setattr(field, attr, False)
+    try:
+        yield
+    finally:
+        for field, attr in fields:
+            setattr(field, attr, True)
+
+
+def read_records(path, file_format):
+    """
+    Пары (номер строки файла, запись); пустые ячейки CSV считаются
+    отсутствующими. Нечитаемая строка — CommandError с её номером.
+    """
+    with open(path, newline="", encoding="utf-8") as source:
+        if file_format == "csv":
+            reader = csv.DictReader(source)
+            try:
+                for row in reader:
+                    yield reader.line_num, {
+                        key: value for key, value in row.items() if value
+                    }
+            except csv.Error as error:
+                raise CommandError(f"Строка {reader.line_num}: {error}")
+            return
+        for line, text in enumerate(source, 1):
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except ValueError as error:
+                raise CommandError(f"Строка {line}: неверный JSON: {error}")
+            if not isinstance(record, dict):
+                raise CommandError(
+                    f"Строка {line}: ожидался объект JSON, а не "
+                    f"{type(record).__name__}."
+                )
+            yield line, record
+
+
+def parse_date(value):
+    if not value:
+        return timezone.now()
+    date = parse_datetime(value)
+    if date is None:
+        raise ValueError(f"Неверная дата: {value!r}")
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+class Command(BaseCommand):
+    help = (
+        "Загружает группы, посты, комментарии и подписки из JSON Lines или "
+        "CSV пачками bulk_create, читая файл потоком, и пересобирает "
+        "производные данные. У каждой записи есть поле type: group, post, "
+        "comment или follow; группы должны идти раньше своих постов, а "
+        "комментарии ссылаются на посты по их id из файла. id из файла "
+        "сохраняется, только если он свободен в базе, иначе запись получает "
+        "новый id. Комментарии к постам, которых нет в файле, пропускаются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=("jsonl", "csv"))
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--skip-rebuild",
+            action="store_true",
+            help="Не пересобирать счётчики, ленты, индекс и миниатюры.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or (
+            "csv" if path.endswith(".csv") else "jsonl"
+        )
+        batch_size = options["batch_size"]
+        self.user_ids = {}
+        self.group_ids = {}
+        self.pending = {kind: [] for kind in KINDS}
+        self.counts = dict.fromkeys(KINDS, 0)
+        # id поста в файле -> id, под которым он записан в базу.
+        self.post_ids = {}
+        self.orphans = 0
+        self.renumbered = dict.fromkeys(("post", "comment"), 0)
+        line = 0
+        with explicit_dates():
+            for line, record in read_records(path, file_format):
+                kind = record.get("type")
+                if kind not in self.pending:
+                    raise CommandError(
+                        f"Строка {line}: неизвестный тип записи {kind!r}."
+                    )
+                self.pending[kind].append(record)
+                if sum(map(len, self.pending.values())) >= batch_size:
+                    self.flush(line)
+            self.flush(line)
+        self.reset_sequences()
+        self.stdout.write(
+            ", ".join(f"{kind}: {self.counts[kind]}" for kind in KINDS)
+        )
+        if self.orphans:
+            self.stdout.write(
+                f"Пропущено комментариев к отсутствующим постам: "
+                f"{self.orphans}"
+            )
+        for label, count in zip(
+            ("Постов", "Комментариев"), self.renumbered.values()
+        ):
+            if count:
+                self.stdout.write(
+                    f"{label} с занятым id загружено под новым id: {count}"
+                )
+        if not options["skip_rebuild"]:
+            for command in REBUILD_COMMANDS:
+                call_command(command, stdout=self.stdout)
+            # Страницы зависят от всех областей кеша сразу.
+            cache.clear()
+
+    def flush(self, line):
+        try:
+            with transaction.atomic():
+                for kind in KINDS:
+                    records = self.pending[kind]
+                    if records:
+                        self.counts[kind] += getattr(self, f"insert_{kind}")(
+                            records
+                        )
+                        self.pending[kind] = []
+        except (IntegrityError, KeyError, ValueError) as error:
+            raise CommandError(
+                f"Пачка, закончившаяся строкой {line}: {error!r}"
+            ) from error
+
+    def resolve(self, known, queryset, field, keys):
+        """Достаёт в known id ещё не встречавшихся ключей."""
+        missing = list({key for key in keys if key not in known})
+        for start in range(0, len(missing), LOOKUP_CHUNK):
+            chunk = missing[start : start + LOOKUP_CHUNK]
+            known.update(
+                queryset.filter(**{f"{field}__in": chunk}).values_list(
+                    field, "pk"
+                )
+            )
+        return [key for key in missing if key not in known]
+
+    def taken(self, model, pks):
+        """Какие из id уже заняты в таблице модели."""
+        pks = list(pks)
+        taken = set()
+        for start in range(0, len(pks), LOOKUP_CHUNK):
+            taken.update(
+                model.objects.filter(
+                    pk__in=pks[start : start + LOOKUP_CHUNK]
+                ).values_list("pk", flat=True)
+            )
+        return taken
+
+    def assign_ids(self, kind, model, records):
+        """
+        id для записей пачки: id из файла, если он свободен в базе и ещё
+        не выдан в этой пачке, иначе следующий после всех известных.
+        """
+        wanted = {
+            int(record["id"])
+            for record in records
+            if record.get("id") is not None
+        }
+        used = self.taken(model, wanted)
+        last = model.objects.order_by("-pk").values_list("pk", flat=True)
+        next_id = max([0, *last[:1], *wanted]) + 1
+        ids = []
+        for record in records:
+            pk = record.get("id")
+            pk = None if pk is None else int(pk)
+            if pk is None or pk in used:
+                if pk is not None:
+                    self.renumbered[kind] += 1
+                pk = next_id
+                next_id += 1
+            used.add(pk)
+            ids.append(pk)
+        return ids
+
+    def users(self, usernames):
+        """id пользователей по именам; отсутствующие создаются без пароля."""
+        new = self.resolve(self.user_ids, User.objects, "username", usernames)
+        if new:
+            User.objects.bulk_create(
+                [
+                    User(username=name, password=make_password(None))
+                    for name in new
+                ],
+                ignore_conflicts=True,
+            )
+            self.resolve(self.user_ids, User.objects, "username", new)
+        return self.user_ids
+
+    def insert_group(self, records):
+        """Группы с уже известным slug не перезаписываются."""
+        new = set(
+            self.resolve(
+                self.group_ids,
+                Group.objects,
+                "slug",
+                [record["slug"] for record in records],
+            )
+        )
+        groups = []
+        for record in records:
+            if record["slug"] in new:
+                new.discard(record["slug"])
+                groups.append(
+                    Group(
+                        slug=record["slug"],
+                        title=record.get("title", record["slug"]),
+                        description=record.get("description", ""),
+                    )
+                )
+        Group.objects.bulk_create(groups)
+        self.resolve(
+            self.group_ids,
+            Group.objects,
+            "slug",
+            [group.slug for group in groups],
+        )
+        return len(groups)
+
+    def insert_post(self, records):
+        user_ids = self.users(record["author"] for record in records)
+        slugs = [record["group"] for record in records if "group" in record]
+        self.resolve(self.group_ids, Group.objects, "slug", slugs)
+        posts = []
+        for record, pk in zip(records, self.assign_ids("post", Post, records)):
+            if record.get("id") is not None:
+                file_id = int(record["id"])
+                if file_id in self.post_ids:
+                    raise ValueError(f"Пост с id {file_id} встречен дважды.")
+                self.post_ids[file_id] = pk
+            pub_date = parse_date(record.get("pub_date"))
+            group = record.get("group")
+            posts.append(
+                Post(
+                    pk=pk,
+                    text=record["text"],
+                    author_id=user_ids[record["author"]],
+                    group_id=self.group_ids[group] if group else None,
+                    image=record.get("image"),
+                    pub_date=pub_date,
+                    updated=pub_date,
+                )
+            )
+        Post.objects.bulk_create(posts)
+        return len(posts)
+
+    def insert_comment(self, records):
+        # id постов в файле и в базе совпадают не всегда: пост с занятым id
+        # записан под новым, а чужой пост базы с тем же id ни при чём.
+        total = len(records)
+        records = [
+            record
+            for record in records
+            if int(record["post"]) in self.post_ids
+        ]
+        self.orphans += total - len(records)
+        user_ids = self.users(record["author"] for record in records)
+        comments = [
+            Comment(
+                pk=pk,
+                post_id=self.post_ids[int(record["post"])],
+                author_id=user_ids[record["author"]],
+                text=record["text"],
+                created=parse_date(record.get("created")),
+            )
+            for record, pk in zip(
+                records, self.assign_ids("comment", Comment, records)
+            )
+        ]
+        Comment.objects.bulk_create(comments)
+        return len(comments)
+
+    def insert_follow(self, records):
+        user_ids = self.users(
+            name
+            for record in records
+            for name in (record["user"], record["author"])
+        )
+        pairs = {
+            (user_ids[record["user"]], user_ids[record["author"]])
+            for record in records
+            if record["user"] != record["author"]
+        }
+        # Уже существующие подписки не дублируются и не считаются.
+        users = list({user_id for user_id, _ in pairs})
+        for start in range(0, len(users), LOOKUP_CHUNK):
+            pairs -= set(
+                Follow.objects.filter(
+                    user_id__in=users[start : start + LOOKUP_CHUNK]
+                ).values_list("user_id", "author_id")
+            )
+        Follow.objects.bulk_create(
+            [
+                Follow(user_id=user_id, author_id=author_id)
+                for user_id, author_id in sorted(pairs)
+            ]
+        )
+        return len(pairs)
+
+    def reset_sequences(self):
+        """После вставки явных id счётчики id должны идти дальше них."""
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [Post, Comment]
+        )
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
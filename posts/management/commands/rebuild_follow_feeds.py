@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from posts import feed
+from posts.models import Follow
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересобирает материализованные ленты подписок и обрезает их "
+        "до FEED_DEPTH записей."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--trim-only",
+            action="store_true",
+            help="Только обрезать ленты, не пересобирая их.",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        last_pk = 0
+        total = 0
+        while True:
+            user_ids = list(
+                Follow.objects.filter(user_id__gt=last_pk)
+                .order_by("user_id")
+                .values_list("user_id", flat=True)
+                .distinct()[:chunk_size]
+            )
+            if not user_ids:
+                break
+            for user_id in user_ids:
+                if options["trim_only"]:
+                    feed.trim(user_id)
+                else:
+                    feed.rebuild(user_id)
+            total += len(user_ids)
+            last_pk = user_ids[-1]
+        self.stdout.write(f"Обработано лент: {total}")
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from posts import search
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Заново индексирует тексты постов для полнотекстового поиска, "
+        "например после загрузки постов в обход сигналов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write(
+                f"Индекс для {connection.vendor} не поддерживается, "
+                "поиск идёт по LIKE."
+            )
+            return
+        chunk_size = options["chunk_size"]
+        last_pk = 0
+        total = 0
+        while True:
+            posts = list(
+                Post.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .only("pk", "text")[:chunk_size]
+            )
+            if not posts:
+                break
+            with transaction.atomic():
+                search.index(posts)
+            total += len(posts)
+            last_pk = posts[-1].pk
+        self.stdout.write(f"Проиндексировано постов: {total}")
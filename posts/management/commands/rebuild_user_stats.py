@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import User
+from posts.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчики постов и подписок пользователей."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        last_pk = 0
+        total = 0
+        while True:
+            user_ids = list(
+                User.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:chunk_size]
+            )
+            if not user_ids:
+                break
+            rebuild_stats(user_ids)
+            total += len(user_ids)
+            last_pk = user_ids[-1]
+        self.stdout.write(f"Пересчитано пользователей: {total}")
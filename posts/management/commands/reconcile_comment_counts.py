@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from posts import cache
+from posts.models import Post
+from posts.signals import post_scopes
+from posts.stats import reconcile_comment_counts
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверяет счётчики комментариев постов с таблицей комментариев и "
+        "исправляет расхождения, например после загрузки в обход сигналов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        last_pk = 0
+        total = 0
+        fixed = 0
+        while True:
+            post_ids = list(
+                Post.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:chunk_size]
+            )
+            if not post_ids:
+                break
+            stale = reconcile_comment_counts(post_ids)
+            for post in stale:
+                cache.bump(*post_scopes(post))
+            total += len(post_ids)
+            fixed += len(stale)
+            last_pk = post_ids[-1]
+        self.stdout.write(f"Проверено постов: {total}, исправлено: {fixed}")
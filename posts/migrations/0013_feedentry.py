@@ -0,0 +1,91 @@
+# Generated by Django 2.2.6 on 2026-10-17 02:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_feeds(apps, schema_editor):
+    Follow = apps.get_model("posts", "Follow")
+    Post = apps.get_model("posts", "Post")
+    FeedEntry = apps.get_model("posts", "FeedEntry")
+    for follow in Follow.objects.iterator():
+        posts = Post.objects.filter(author_id=follow.author_id).order_by(
+            "-pub_date"
+        )[: settings.FEED_DEPTH]
+        FeedEntry.objects.bulk_create(
+            [
+                FeedEntry(
+                    user_id=follow.user_id,
+                    post_id=post.pk,
+                    author_id=post.author_id,
+                    pub_date=post.pub_date,
+                )
+                for post in posts
+            ],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("posts", "0012_userstats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FeedEntry",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("pub_date", models.DateTimeField()),
+                (
+                    "author",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="feed_entries",
+                        to="posts.Post",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="feed_entries",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="feedentry",
+            index=models.Index(
+                fields=["user", "-pub_date", "-post"],
+                name="feed_user_pub_date_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="feedentry",
+            constraint=models.UniqueConstraint(
+                fields=("user", "post"), name="unique_feed_entry"
+            ),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.6 on 2026-10-17 03:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def copy_pub_date(apps, schema_editor):
+    Post = apps.get_model("posts", "Post")
+    Post.objects.update(updated=models.F("pub_date"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0013_feedentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="updated",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                verbose_name="Дата изменения",
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_pub_date, migrations.RunPython.noop),
+    ]
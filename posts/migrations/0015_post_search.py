@@ -0,0 +1,49 @@
+# Generated by Django 2.2.6 on 2026-10-17 04:10
+
+from django.conf import settings
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE TABLE posts_post_search ("
+            "post_id integer PRIMARY KEY REFERENCES posts_post (id) "
+            "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX posts_post_search_document "
+            "ON posts_post_search USING GIN (document)"
+        )
+        schema_editor.execute(
+            "INSERT INTO posts_post_search (post_id, document) "
+            "SELECT id, to_tsvector(%s, text) FROM posts_post",
+            [settings.SEARCH_CONFIG],
+        )
+    elif connection.vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE posts_post_search USING fts5("
+            "text, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            "INSERT INTO posts_post_search (rowid, text) "
+            "SELECT id, text FROM posts_post"
+        )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ("postgresql", "sqlite"):
+        schema_editor.execute("DROP TABLE posts_post_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0014_post_updated"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
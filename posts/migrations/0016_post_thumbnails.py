@@ -0,0 +1,23 @@
+# Generated by Django 2.2.6 on 2026-10-17 02:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0015_post_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="thumbnails",
+            field=models.TextField(
+                blank=True,
+                default="",
+                editable=False,
+                verbose_name="Миниатюры",
+            ),
+        ),
+    ]
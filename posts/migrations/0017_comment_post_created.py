@@ -0,0 +1,23 @@
+# Generated by Django 2.2.6 on 2026-10-17 03:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0016_post_thumbnails"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="comment",
+            options={"ordering": ("created",)},
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["post", "created"], name="comment_post_created_idx"
+            ),
+        ),
+    ]
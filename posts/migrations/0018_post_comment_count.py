@@ -0,0 +1,36 @@
+# Generated by Django 2.2.6 on 2026-10-17 03:05
+
+from django.db import migrations, models
+
+
+def fill_comment_counts(apps, schema_editor):
+    Post = apps.get_model("posts", "Post")
+    Comment = apps.get_model("posts", "Comment")
+    counts = (
+        Comment.objects.filter(post=models.OuterRef("pk"))
+        .order_by()
+        .values("post")
+        .annotate(count=models.Count("pk"))
+        .values("count")
+    )
+    Post.objects.filter(pk__in=Comment.objects.values("post")).update(
+        comment_count=models.Subquery(counts)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0017_comment_post_created"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="comment_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Комментарии"
+            ),
+        ),
+        migrations.RunPython(fill_comment_counts, migrations.RunPython.noop),
+    ]
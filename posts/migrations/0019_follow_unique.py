@@ -0,0 +1,37 @@
+# Generated by Django 2.2.6 on 2026-10-17 03:07
+
+from django.db import migrations, models
+
+
+def remove_duplicates(apps, schema_editor):
+    Follow = apps.get_model("posts", "Follow")
+    first = (
+        Follow.objects.values("user", "author")
+        .annotate(first=models.Min("pk"))
+        .values_list("first", flat=True)
+    )
+    # Счётчики подписок после этого сверяет rebuild_user_stats.
+    Follow.objects.exclude(pk__in=list(first)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0018_post_comment_count"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="follow",
+            index=models.Index(
+                fields=["author", "user"], name="follow_author_user_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="follow",
+            constraint=models.UniqueConstraint(
+                fields=("user", "author"), name="unique_follow"
+            ),
+        ),
+    ]
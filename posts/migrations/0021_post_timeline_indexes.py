@@ -0,0 +1,27 @@
+# Generated by Django 2.2.6 on 2026-10-17 03:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0020_suggestion"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["author", "-pub_date", "-id"],
+                name="post_author_pub_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["group", "-pub_date", "-id"],
+                name="post_group_pub_date_idx",
+            ),
+        ),
+    ]
@@ -1,5 +1,8 @@
+import json
+
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils.functional import cached_property
 
 User = get_user_model()
 
@@ -29,12 +32,38 @@ class Post(models.Model):
         related_name="group_posts",
     )
     image = models.ImageField(upload_to="posts/", blank=True, null=True)
+    updated = models.DateTimeField("Дата изменения", auto_now=True)
+    # Поддерживается сигналами комментариев; сверяется командой
+    # reconcile_comment_counts.
+    comment_count = models.PositiveIntegerField(
+        "Комментарии", default=0, editable=False
+    )
+    # Готовые варианты картинки для шаблона (см. thumbnails.variants), в JSON.
+    thumbnails = models.TextField(
+        "Миниатюры", blank=True, default="", editable=False
+    )
 
     def __str__(self):
         return self.text
 
+    @cached_property
+    def thumbnail_set(self):
+        return json.loads(self.thumbnails or "{}")
+
     class Meta:
         ordering = ("-pub_date",)
+        # Ленты автора и группы идут по (pub_date, id) в обратном порядке;
+        # id в индексе нужен, чтобы не досортировывать посты одной секунды.
+        indexes = [
+            models.Index(
+                fields=("author", "-pub_date", "-id"),
+                name="post_author_pub_date_idx",
+            ),
+            models.Index(
+                fields=("group", "-pub_date", "-id"),
+                name="post_group_pub_date_idx",
+            ),
+        ]
 
 
 class Comment(models.Model):
@@ -47,6 +76,14 @@ class Comment(models.Model):
     text = models.TextField()
     created = models.DateTimeField("Дата публикации", auto_now_add=True)
 
+    class Meta:
+        ordering = ("created",)
+        indexes = [
+            models.Index(
+                fields=("post", "created"), name="comment_post_created_idx"
+            ),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -55,3 +92,77 @@ class Follow(models.Model):
     author = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="following"
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=("user", "author"), name="unique_follow"
+            ),
+        ]
+        indexes = [
+            # Обратный обход графа: подписчики автора.
+            models.Index(
+                fields=("author", "user"), name="follow_author_user_idx"
+            ),
+        ]
+
+
+class Suggestion(models.Model):
+    """Кандидат в подписки для пользователя, посчитанный заранее."""
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="suggestions"
+    )
+    candidate = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="+"
+    )
+    # Сколько авторов из подписок пользователя подписаны на кандидата.
+    mutual = models.PositiveIntegerField(default=0)
+    score = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=("user", "candidate"), name="unique_suggestion"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=("user", "-score"), name="suggestion_user_score_idx"
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    post_count = models.PositiveIntegerField(default=0)
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="feed_entries"
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="feed_entries"
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="+"
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=("user", "post"), name="unique_feed_entry"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=("user", "-pub_date", "-post"),
+                name="feed_user_pub_date_idx",
+            ),
+        ]
@@ -0,0 +1,355 @@
+import collections.abc
+import heapq
+import itertools
+import math
+from datetime import datetime, timezone
+
+from django.core.paginator import Page, Paginator
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils.encoding import force_bytes, force_str
+from django.utils.functional import SimpleLazyObject, cached_property
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+NEXT = "n"
+PREVIOUS = "p"
+# Наибольший id, который СУБД примет в параметре запроса.
+MAX_PK = 2**63 - 1
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    # repr() восстанавливает float точно, без потери знаков.
+    return repr(float(value))
+
+
+def _decode_value(value):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return float(value)
+
+
+def encode_cursor(direction, obj, key="pub_date", tiebreak="pk"):
+    value = _encode_value(getattr(obj, key))
+    token = f"{direction}|{value}|{getattr(obj, tiebreak)}"
+    return urlsafe_base64_encode(force_bytes(token))
+
+
+def _check_value(value, key_type):
+    """Значение ключа должно годиться в запрос по полю ленты."""
+    if not isinstance(value, key_type):
+        raise TypeError(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            raise ValueError(value)
+        # Дата у границы диапазона не переводится в UTC при запросе.
+        value.astimezone(timezone.utc)
+    elif not math.isfinite(value):
+        raise ValueError(value)
+
+
+def decode_cursor(token, key_type=datetime):
+    """
+    (направление, значение ключа, id) из курсора. Курсор, подделанный
+    или собранный для ленты с другим типом ключа, — InvalidCursor.
+    """
+    try:
+        direction, value, pk = force_str(urlsafe_base64_decode(token)).split(
+            "|"
+        )
+        if direction not in (NEXT, PREVIOUS):
+            raise ValueError(direction)
+        value, pk = _decode_value(value), int(pk)
+        _check_value(value, key_type)
+        if not 0 < pk <= MAX_PK:
+            raise ValueError(pk)
+        return direction, value, pk
+    except (TypeError, ValueError, OverflowError) as error:
+        raise InvalidCursor(token) from error
+
+
+class CursorPage(collections.abc.Sequence):
+    def __init__(self, object_list, paginator, cursor, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.cursor = cursor
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f"<CursorPage {self.cursor or 'first'}>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_cursor(self):
+        if not self.has_next() or not self.object_list:
+            return None
+        return self.paginator.cursor_for(NEXT, self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        # Курсор за концом ленты даёт пустую страницу: ссылаться не от чего.
+        if not self.has_previous() or not self.object_list:
+            return None
+        return self.paginator.cursor_for(PREVIOUS, self.object_list[0])
+
+
+def estimate_count(queryset):
+    """
+    Примерное число строк таблицы без COUNT(*): из статистики
+    планировщика PostgreSQL или по наибольшему id на других СУБД.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                [model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        return int(row[0]) if row else 0
+    return (
+        model._default_manager.using(queryset.db).aggregate(count=Max("pk"))[
+            "count"
+        ]
+        or 0
+    )
+
+
+class ApproximateCountPaginator(Paginator):
+    """
+    Paginator для админки больших таблиц: без фильтров число строк
+    берётся из estimate_count, точный COUNT(*) — только для небольших
+    таблиц и отфильтрованных списков.
+    """
+
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_count(queryset)
+            if estimate > self.exact_count_limit:
+                return estimate
+        return queryset.count()
+
+
+class CursorPaginator:
+    """
+    Постраничный вывод по ключу (pub_date, id) вместо OFFSET.
+
+    Стоимость любой страницы — один индексный проход на per_page + 1
+    строк, без COUNT(*) и без пропуска предыдущих страниц. По умолчанию
+    лента идёт от новых строк к старым, descending=False — наоборот.
+    """
+
+    # Тип значений key: курсор с другим типом не принимается.
+    key_type = datetime
+
+    def __init__(
+        self,
+        object_list,
+        per_page,
+        key="pub_date",
+        tiebreak="pk",
+        descending=True,
+    ):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.key = key
+        self.tiebreak = tiebreak
+        self.descending = descending
+
+    def cursor_for(self, direction, obj):
+        return encode_cursor(direction, obj, self.key, self.tiebreak)
+
+    def ordered(self, forward=True):
+        """Строки в порядке ленты или, при forward=False, в обратном."""
+        sign = "-" if forward == self.descending else ""
+        return self.object_list.order_by(
+            f"{sign}{self.key}", f"{sign}{self.tiebreak}"
+        )
+
+    def _beyond(self, queryset, lookup, value, pk):
+        # Избыточная граница по key нужна, чтобы СУБД шла по индексу
+        # диапазоном, а не фильтровала всю таблицу условием с OR.
+        return queryset.filter(
+            Q(**{f"{self.key}__{lookup}": value})
+            | Q(**{self.key: value, f"{self.tiebreak}__{lookup}": pk}),
+            **{f"{self.key}__{lookup}e": value},
+        )
+
+    def after(self, value, pk):
+        """Строки, идущие в ленте после (value, pk)."""
+        lookup = "lt" if self.descending else "gt"
+        return self._beyond(self.ordered(), lookup, value, pk)
+
+    def before(self, value, pk):
+        """Строки, идущие в ленте до (value, pk), начиная с ближайшей."""
+        lookup = "gt" if self.descending else "lt"
+        return self._beyond(self.ordered(forward=False), lookup, value, pk)
+
+    def fetch(self, direction, position=None, limit=None):
+        """
+        Возвращает до limit строк после (NEXT) или до (PREVIOUS) позиции
+        position = (value, pk) в порядке удаления от неё.
+        """
+        if position is None:
+            queryset = self.ordered(forward=direction == NEXT)
+        elif direction == NEXT:
+            queryset = self.after(*position)
+        else:
+            queryset = self.before(*position)
+        return list(queryset[:limit])
+
+    def sequence(self):
+        """Объект для обычного Paginator со страницами ?page=N."""
+        return self.ordered()
+
+    def page(self, cursor=None):
+        if not cursor:
+            return self._first_page()
+        direction, value, pk = decode_cursor(cursor, self.key_type)
+        rows = self.fetch(direction, (value, pk), self.per_page + 1)
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if direction == NEXT:
+            return CursorPage(rows, self, cursor, has_more, True)
+        if not has_more:
+            # Дошли до начала ленты: отдаём полную первую страницу.
+            return self._first_page()
+        rows.reverse()
+        return CursorPage(rows, self, cursor, True, True)
+
+    def get_page(self, cursor=None):
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self._first_page()
+
+    def _first_page(self):
+        rows = self.fetch(NEXT, limit=self.per_page + 1)
+        return CursorPage(
+            rows[: self.per_page], self, None, len(rows) > self.per_page, False
+        )
+
+
+class MergedCursorPaginator(CursorPaginator):
+    """
+    Курсорная лента, собранная k-way слиянием нескольких источников.
+
+    Каждый источник — CursorPaginator со своим запросом; строки всех
+    источников должны иметь атрибуты key и tiebreak этой ленты.
+    """
+
+    def __init__(self, sources, per_page, key="pub_date", tiebreak="pk"):
+        super().__init__(None, per_page, key, tiebreak)
+        self.sources = sources
+
+    def sort_key(self, obj):
+        return getattr(obj, self.key), getattr(obj, self.tiebreak)
+
+    def fetch(self, direction, position=None, limit=None):
+        rows = heapq.merge(
+            *(
+                source.fetch(direction, position, limit)
+                for source in self.sources
+            ),
+            key=self.sort_key,
+            reverse=direction == NEXT,
+        )
+        return list(itertools.islice(rows, limit))
+
+    def count(self):
+        return sum(source.object_list.count() for source in self.sources)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.fetch(NEXT, limit=index.stop)[index]
+        return self.fetch(NEXT, limit=index + 1)[index]
+
+    def sequence(self):
+        return self
+
+
+def paginate(request, queryset, per_page=10, key="pub_date", tiebreak="pk"):
+    """
+    Возвращает пару (paginator, page) для ленты постов.
+
+    Запросы с ?cursor= и первую страницу обслуживает CursorPaginator,
+    обычный Paginator — только явные ?page=N, чтобы старые ссылки
+    продолжали работать. Ссылка «Следующая» во всех случаях ведёт
+    на курсор.
+    """
+    return paginate_feed(
+        request, CursorPaginator(queryset, per_page, key, tiebreak)
+    )
+
+
+def first_page(cursor_paginator):
+    """
+    Первая страница ленты из CursorPaginator в обёртке обычного Page.
+
+    Строки читаются одним запросом на per_page + 1 строк и лениво,
+    чтобы при взятом из кеша фрагменте не было ни одного запроса;
+    has_next() берётся из лишней строки, поэтому COUNT(*) и page_range
+    не вычисляются.
+    """
+    per_page = cursor_paginator.per_page
+    rows = SimpleLazyObject(
+        lambda: cursor_paginator.fetch(NEXT, limit=per_page + 1)
+    )
+    page = Page(
+        SimpleLazyObject(lambda: rows[:per_page]),
+        1,
+        Paginator(cursor_paginator.sequence(), per_page),
+    )
+    page.has_next = lambda: len(rows) > per_page
+    return page
+
+
+def paginate_feed(request, cursor_paginator):
+    cursor = request.GET.get("cursor")
+    if cursor:
+        return cursor_paginator, cursor_paginator.get_page(cursor)
+    if "page" in request.GET:
+        paginator = Paginator(
+            cursor_paginator.sequence(), cursor_paginator.per_page
+        )
+        page = paginator.get_page(request.GET.get("page"))
+        page.numbered = True
+    else:
+        page = first_page(cursor_paginator)
+        paginator = page.paginator
+    # Лениво: строки страницы не читаются, пока шаблон не попросит ссылку,
+    # и не читаются вовсе, если фрагмент взят из кеша.
+    page.next_cursor = SimpleLazyObject(
+        lambda: (
+            cursor_paginator.cursor_for(NEXT, page[-1])
+            if page.has_next()
+            else None
+        )
+    )
+    return paginator, page
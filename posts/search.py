@@ -0,0 +1,175 @@
+"""
+Полнотекстовый поиск по постам.
+
+На SQLite индекс — виртуальная таблица FTS5, на PostgreSQL — таблица с
+tsvector и индексом GIN. Таблица создаётся миграцией, а строки
+обновляются сигналами при сохранении и удалении поста. На остальных СУБД
+индекса нет, и поиск идёт по LIKE от новых постов к старым.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+from .paginator import NEXT, CursorPaginator
+
+TABLE = "posts_post_search"
+# СУБД, для которых миграция 0015 создаёт индекс.
+VENDORS = ("postgresql", "sqlite")
+# Ограничение длины запроса: каждое слово — отдельный проход по индексу.
+MAX_TERMS = 8
+WORD = re.compile(r"\w+")
+
+
+def terms(query):
+    return WORD.findall(query)[:MAX_TERMS]
+
+
+def is_supported():
+    return connection.vendor in VENDORS
+
+
+def _like(query):
+    """Посты, содержащие все слова запроса, — запасной путь без индекса."""
+    condition = Q()
+    for word in terms(query):
+        condition &= Q(text__icontains=word)
+    return Post.objects.filter(condition)
+
+
+def _match(query):
+    """Выражение запроса на языке индекса: все слова, по префиксу."""
+    words = terms(query)
+    if connection.vendor == "postgresql":
+        return " & ".join(f"{word}:*" for word in words)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def _ranked_sql():
+    """Подзапрос (id, score) совпавших постов: больше score — выше."""
+    if connection.vendor == "postgresql":
+        return (
+            "SELECT post_id AS id, ts_rank(document, query) AS score "
+            f"FROM {TABLE}, to_tsquery(%s, %s) query "
+            "WHERE document @@ query",
+            [settings.SEARCH_CONFIG],
+        )
+    return (
+        f"SELECT rowid AS id, -bm25({TABLE}) AS score "
+        f"FROM {TABLE} WHERE {TABLE} MATCH %s",
+        [],
+    )
+
+
+def matching(query):
+    """Подзапрос id постов, подходящих под запрос, для filter(pk__in=)."""
+    if not is_supported():
+        return _like(query).values("pk")
+    sql, params = _ranked_sql()
+    return RawSQL(
+        f"SELECT id FROM ({sql}) AS matches", (*params, _match(query))
+    )
+
+
+def ranked(query, direction=NEXT, position=None, limit=None):
+    """
+    Пары (id, rank) в порядке убывания rank после (NEXT) или до
+    (PREVIOUS) позиции position = (rank, id).
+    """
+    if not terms(query):
+        return []
+    if not is_supported():
+        return _ranked_like(query, direction, position, limit)
+    sql, params = _ranked_sql()
+    params = [*params, _match(query)]
+    sign, order = ("<", "DESC") if direction == NEXT else (">", "ASC")
+    sql = f"SELECT id, score FROM ({sql}) AS matches"
+    if position is not None:
+        rank, pk = position
+        sql += f" WHERE score {sign} %s OR (score = %s AND id {sign} %s)"
+        params += [rank, rank, pk]
+    sql += f" ORDER BY score {order}, id {order}"
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _ranked_like(query, direction, position, limit):
+    """Совпадения по LIKE; rank — id поста, свежие посты выше."""
+    posts = _like(query)
+    if direction == NEXT:
+        posts = posts.order_by("-pk")
+        if position is not None:
+            posts = posts.filter(pk__lt=position[1])
+    else:
+        posts = posts.order_by("pk")
+        if position is not None:
+            posts = posts.filter(pk__gt=position[1])
+    return [
+        (pk, float(pk)) for pk in posts.values_list("pk", flat=True)[:limit]
+    ]
+
+
+def index(posts):
+    """Добавляет посты в индекс или обновляет их текст."""
+    rows = [(post.pk, post.text) for post in posts]
+    if not rows or not is_supported():
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (post_id, document) "
+                "VALUES (%s, to_tsvector(%s, %s)) "
+                "ON CONFLICT (post_id) DO UPDATE "
+                "SET document = EXCLUDED.document",
+                [(pk, settings.SEARCH_CONFIG, text) for pk, text in rows],
+            )
+        else:
+            cursor.executemany(
+                f"DELETE FROM {TABLE} WHERE rowid = %s",
+                [(pk,) for pk, _ in rows],
+            )
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (rowid, text) VALUES (%s, %s)", rows
+            )
+
+
+def remove(post_ids):
+    if not is_supported():
+        return
+    column = "post_id" if connection.vendor == "postgresql" else "rowid"
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {TABLE} WHERE {column} = %s",
+            [(pk,) for pk in post_ids],
+        )
+
+
+class SearchPaginator(CursorPaginator):
+    """Курсорная выдача поиска по ключу (rank, id)."""
+
+    key_type = float
+
+    def __init__(self, query, per_page):
+        super().__init__(None, per_page, key="rank", tiebreak="pk")
+        self.query = query
+
+    def fetch(self, direction, position=None, limit=None):
+        rows = ranked(self.query, direction, position, limit)
+        posts = Post.objects.select_related("author").in_bulk(
+            [pk for pk, _ in rows]
+        )
+        result = []
+        for pk, rank in rows:
+            post = posts.get(pk)
+            if post is not None:
+                post.rank = rank
+                result.append(post)
+        return result
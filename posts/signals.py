@@ -0,0 +1,149 @@
+import threading
+
+from django.db.models.signals import (
+    post_delete,
+    post_init,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from . import cache, feed, search, suggestions
+from .models import Comment, Follow, Group, Post, User
+from .stats import bump_comment_count, bump_stats
+
+_state = threading.local()
+
+
+def deleting_posts():
+    """id постов, которые сейчас удаляются в этом потоке."""
+    if not hasattr(_state, "posts"):
+        _state.posts = set()
+    return _state.posts
+
+
+def post_scopes(post):
+    scopes = [cache.GLOBAL, cache.author(post.author_id), cache.post(post.pk)]
+    for group_id in {post.group_id, post._initial_group_id}:
+        if group_id is not None:
+            scopes.append(cache.group(group_id))
+    return scopes
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    # Через __dict__, чтобы не подгружать отложенное поле запросом.
+    instance._initial_group_id = instance.__dict__.get("group_id")
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        bump_stats(instance.author_id, post_count=1)
+        feed.fan_out(instance)
+    else:
+        feed.bump_followers(instance.author_id)
+    search.index([instance])
+    cache.bump(*post_scopes(instance))
+    instance._initial_group_id = instance.group_id
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    # Комментарии удаляются каскадом раньше поста; их счётчик и кеш
+    # уходят вместе с постом, поэтому по одному их не обрабатываем.
+    deleting_posts().add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    deleting_posts().discard(instance.pk)
+    bump_stats(instance.author_id, post_count=-1)
+    feed.bump_followers(instance.author_id)
+    search.remove([instance.pk])
+    cache.bump(*post_scopes(instance))
+
+
+def comment_post(comment):
+    """
+    Пост комментария с полями, от которых зависят области кеша, или None,
+    если пост уже удалён.
+    """
+    if Comment.post.is_cached(comment):
+        return comment.post
+    row = (
+        Post.objects.filter(pk=comment.post_id)
+        .values_list("author_id", "group_id")
+        .first()
+    )
+    if row is None:
+        return None
+    author_id, group_id = row
+    return Post(pk=comment.post_id, author_id=author_id, group_id=group_id)
+
+
+def bump_comment_scopes(comment):
+    # Число комментариев видно и в лентах, где показан пост, поэтому
+    # сбрасываются те же области, что и при правке поста.
+    post = comment_post(comment)
+    if post is None:
+        cache.bump(cache.post(comment.post_id))
+        return
+    feed.bump_followers(post.author_id)
+    cache.bump(*post_scopes(post))
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        bump_comment_count(instance.post_id, 1)
+    bump_comment_scopes(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.post_id in deleting_posts():
+        return
+    bump_comment_count(instance.post_id, -1)
+    bump_comment_scopes(instance)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    cache.bump(cache.group(instance.pk))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Вход обновляет только last_login, страниц это не меняет.
+    if created or update_fields == frozenset({"last_login"}):
+        return
+    cache.bump(cache.author(instance.pk))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    cache.bump(cache.author(instance.pk), cache.user(instance.pk))
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        bump_stats(instance.author_id, follower_count=1)
+        bump_stats(instance.user_id, following_count=1)
+        feed.backfill(instance.user_id, instance.author_id)
+        suggestions.follow_changed(instance.user_id, instance.author_id, 1)
+        cache.bump(
+            cache.user(instance.user_id), cache.author(instance.author_id)
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    bump_stats(instance.author_id, follower_count=-1)
+    bump_stats(instance.user_id, following_count=-1)
+    feed.prune(instance.user_id, instance.author_id)
+    feed.resume_push(instance.author_id)
+    suggestions.follow_changed(instance.user_id, instance.author_id, -1)
+    cache.bump(cache.user(instance.user_id), cache.author(instance.author_id))
@@ -0,0 +1,107 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import Comment, Follow, Post, UserStats
+
+
+def count_stats(user_ids):
+    """Считает счётчики заново по таблицам Post и Follow."""
+    stats = {user_id: UserStats(user_id=user_id) for user_id in user_ids}
+    counters = (
+        (Post.objects, "author", "post_count"),
+        (Follow.objects, "author", "follower_count"),
+        (Follow.objects, "user", "following_count"),
+    )
+    for manager, field, counter in counters:
+        rows = (
+            manager.filter(**{f"{field}__in": user_ids})
+            .order_by()
+            .values_list(field)
+            .annotate(count=Count("pk"))
+        )
+        for user_id, count in rows:
+            setattr(stats[user_id], counter, count)
+    return list(stats.values())
+
+
+def rebuild_stats(user_ids):
+    with transaction.atomic():
+        UserStats.objects.filter(user_id__in=user_ids).delete()
+        UserStats.objects.bulk_create(count_stats(user_ids))
+
+
+def _create_stats(user_id):
+    stats = count_stats([user_id])[0]
+    try:
+        with transaction.atomic():
+            stats.save(force_insert=True)
+    except IntegrityError:
+        # Запись успела создать параллельная транзакция.
+        return None
+    return stats
+
+
+def get_stats(user):
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        stats = _create_stats(user.pk) or UserStats.objects.get(pk=user.pk)
+        user.stats = stats
+        return stats
+
+
+def bump_stats(user_id, **deltas):
+    """
+    Атомарно сдвигает счётчики пользователя одним UPDATE.
+
+    Если записи ещё нет, при увеличении она создаётся пересчётом, при
+    уменьшении пропускается: её соберёт get_stats или rebuild_user_stats.
+    Разошедшийся с таблицами счётчик ниже нуля не опускается.
+    """
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        **{
+            field: (
+                F(field) + delta
+                if delta > 0
+                else Greatest(F(field) + delta, 0)
+            )
+            for field, delta in deltas.items()
+        }
+    )
+    if not updated and all(delta > 0 for delta in deltas.values()):
+        if _create_stats(user_id) is None:
+            bump_stats(user_id, **deltas)
+
+
+def bump_comment_count(post_id, delta):
+    """Атомарно сдвигает счётчик комментариев поста одним UPDATE."""
+    posts = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        # Счётчик мог разойтись с таблицей; ниже нуля он не опускается.
+        posts = posts.filter(comment_count__gte=-delta)
+    posts.update(comment_count=F("comment_count") + delta)
+
+
+def reconcile_comment_counts(post_ids):
+    """
+    Сверяет счётчики комментариев постов с таблицей Comment и исправляет
+    расхождения. Возвращает исправленные посты.
+    """
+    counts = dict(
+        Comment.objects.filter(post_id__in=post_ids)
+        .order_by()
+        .values_list("post")
+        .annotate(count=Count("pk"))
+    )
+    posts = Post.objects.filter(pk__in=post_ids).only(
+        "pk", "author", "group", "comment_count"
+    )
+    stale = []
+    for post in posts:
+        count = counts.get(post.pk, 0)
+        if post.comment_count != count:
+            post.comment_count = count
+            stale.append(post)
+    Post.objects.bulk_update(stale, ["comment_count"])
+    return stale
@@ -0,0 +1,109 @@
+"""
+Подсказки «на кого подписаться» по друзьям друзей.
+
+Кандидат — автор, на которого подписаны авторы из подписок
+пользователя; чем больше таких общих подписок и чем активнее автор,
+тем выше оценка. Кандидаты считаются пакетами пользователей и хранятся в
+Suggestion, так что панель читается одним запросом по индексу
+(user, -score). При подписке и отписке подсказки самого пользователя
+пересчитываются, а у его подписчиков сдвигается число общих подписок;
+новые кандидаты у них появятся при пакетном пересчёте
+(compute_suggestions).
+"""
+
+import heapq
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import Follow, Suggestion, UserStats
+
+BATCH_SIZE = 1000
+
+
+def score(mutual, post_count):
+    weight = settings.SUGGESTION_ACTIVITY_WEIGHT
+    return mutual + weight * math.log1p(post_count)
+
+
+def candidates(user_ids):
+    """{user_id: {candidate_id: mutual}} для пользователей user_ids."""
+    # Follow подписок второго уровня: их user — автор, на которого
+    # подписан кто-то из user_ids.
+    rows = (
+        Follow.objects.filter(user__following__user_id__in=user_ids)
+        .order_by()
+        .values_list("user__following__user_id", "author_id")
+        .annotate(mutual=Count("pk"))
+    )
+    followed = defaultdict(set)
+    for user_id, author_id in Follow.objects.filter(
+        user_id__in=user_ids
+    ).values_list("user_id", "author_id"):
+        followed[user_id].add(author_id)
+    found = defaultdict(dict)
+    for user_id, candidate_id, mutual in rows:
+        if candidate_id != user_id and candidate_id not in followed[user_id]:
+            found[user_id][candidate_id] = mutual
+    return found
+
+
+def compute(user_ids):
+    """Заново считает и сохраняет подсказки пользователей user_ids."""
+    found = candidates(user_ids)
+    candidate_ids = set()
+    for mutuals in found.values():
+        candidate_ids.update(mutuals)
+    post_counts = dict(
+        UserStats.objects.filter(user_id__in=candidate_ids).values_list(
+            "user_id", "post_count"
+        )
+    )
+    rows = []
+    for user_id, mutuals in found.items():
+        ranked = heapq.nlargest(
+            settings.SUGGESTIONS_PER_USER,
+            (
+                (score(mutual, post_counts.get(candidate_id, 0)), candidate_id)
+                for candidate_id, mutual in mutuals.items()
+            ),
+        )
+        rows.extend(
+            Suggestion(
+                user_id=user_id,
+                candidate_id=candidate_id,
+                mutual=mutuals[candidate_id],
+                score=value,
+            )
+            for value, candidate_id in ranked
+        )
+    with transaction.atomic():
+        Suggestion.objects.filter(user_id__in=user_ids).delete()
+        Suggestion.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+
+
+def follow_changed(user_id, author_id, delta):
+    """Подписка (delta=1) или отписка (delta=-1) user_id на author_id."""
+    compute([user_id])
+    # У подписчиков user_id автор стал (или перестал быть) общей подпиской.
+    suggestions = Suggestion.objects.filter(
+        user_id__in=Follow.objects.filter(author_id=user_id).values("user_id"),
+        candidate_id=author_id,
+    )
+    suggestions.update(mutual=F("mutual") + delta, score=F("score") + delta)
+    if delta < 0:
+        suggestions.filter(mutual=0).delete()
+
+
+def for_user(user, limit=None):
+    if user.is_anonymous:
+        return []
+    limit = settings.SUGGESTIONS_SHOWN if limit is None else limit
+    return list(
+        Suggestion.objects.filter(user=user)
+        .select_related("candidate")
+        .order_by("-score")[:limit]
+    )
@@ -0,0 +1,64 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from posts import thumbnails
+
+register = template.Library()
+
+EDIT_LINK = mark_safe("<!--post-edit-link-->")
+
+
+def item_key(post):
+    # Счётчик комментариев и имя автора в ссылках карточки меняются без
+    # изменения updated.
+    return (
+        f"post_item:{post.pk}:{post.updated.timestamp()}:"
+        f"{post.comment_count}:{post.author.username}"
+    )
+
+
+def render_items(posts, user):
+    """
+    Рендерит карточки постов, беря общую для всех часть из кеша одним
+    get_many. Ссылка «Редактировать» подставляется для каждого
+    зрителя отдельно.
+    """
+    keys = [item_key(post) for post in posts]
+    cached = cache.get_many(keys)
+    thumbnails.prefetch(
+        [post for key, post in zip(keys, posts) if key not in cached]
+    )
+    missing = {}
+    items = []
+    for key, post in zip(keys, posts):
+        html = cached.get(key)
+        if html is None:
+            html = render_to_string(
+                "includes/post_item.html",
+                {"post": post, "edit_link": EDIT_LINK},
+            )
+            missing[key] = html
+        edit_link = ""
+        if user is not None and user.pk == post.author_id:
+            edit_link = render_to_string(
+                "includes/post_edit_link.html", {"post": post}
+            )
+        items.append(html.replace(EDIT_LINK, edit_link))
+    if missing:
+        cache.set_many(missing, settings.FRAGMENT_CACHE_TIMEOUT)
+    return mark_safe("".join(items))
+
+
+@register.simple_tag(takes_context=True)
+def post_items(context, page):
+    """Карточки постов страницы; элементы ленты подписок — FeedEntry."""
+    posts = [getattr(item, "post", item) for item in page]
+    return render_items(posts, context.get("user"))
+
+
+@register.simple_tag(takes_context=True)
+def post_item(context, post):
+    return render_items([post], context.get("user"))
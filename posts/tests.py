@@ -1,15 +1,70 @@
-from time import sleep
+import csv
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest import mock
 
+from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
-from django.urls import reverse
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from PIL import Image
+from sorl.thumbnail import get_thumbnail
 
-from posts.models import Follow, Group, Post, User
+from posts import cache as page_cache
+from posts import feed, search, signals, suggestions, thumbnails
+from posts.management.commands.check_query_plans import (
+    Command as CheckQueryPlans,
+)
+from posts.models import (
+    Comment,
+    FeedEntry,
+    Follow,
+    Group,
+    Post,
+    User,
+    UserStats,
+)
+from posts.paginator import NEXT, encode_cursor
+from posts.templatetags.post_tags import EDIT_LINK, render_items
+from yatube import db
+from yatube.sqlite3.base import DatabaseWrapper as TunedSQLiteWrapper
+from yatube.sqlite_cache import SQLiteCache
+
+# Рабочий кеш сайта лежит в файле и общий для всех процессов, а
+# загрузки сохраняются в MEDIA_ROOT; тесты пишут во временные копии.
+media_root = tempfile.TemporaryDirectory()
+test_settings = override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    },
+    MEDIA_ROOT=media_root.name,
+)
+
+
+def setUpModule():
+    test_settings.enable()
+
+
+def tearDownModule():
+    test_settings.disable()
+    media_root.cleanup()
 
 
 class PostAppTest(TestCase):
     def setUp(self):
+        cache.clear()
         # создание авторизованного пользователя
         self.authorized_client = Client()
         self.user = User.objects.create_user(
@@ -227,29 +282,55 @@ class PostAppTest(TestCase):
 
     def test_index_page_cache(self):
         """
-        Проверка кеширования главной страницы.
+        Проверка кеширования главной страницы: фрагмент живёт, пока не
+        изменились посты, а новый пост виден сразу.
         """
 
         cache.clear()
 
-        Post.objects.create(
+        post = Post.objects.create(
             text="cached",
             author=self.user,
         )
         response = self.authorized_client.get(reverse("index"))
         self.assertContains(response, "cached")
 
+        # update() не шлёт сигналов, поэтому поколение не меняется
+        Post.objects.filter(pk=post.pk).update(
+            text="changed", updated=timezone.now()
+        )
+        response = self.authorized_client.get(reverse("index"))
+        self.assertNotContains(response, "changed")
+
         Post.objects.create(
             text="not_cached",
             author=self.user,
         )
         response = self.authorized_client.get(reverse("index"))
-        self.assertNotContains(response, "not_cached")
+        self.assertContains(response, "not_cached")
+        self.assertContains(response, "changed")
+
+    def test_cached_feed_not_shared_between_users(self):
+        """
+        Закешированная лента подписок и кнопка «Редактировать» не
+        переходят к другому пользователю.
+        """
+
+        cache.clear()
 
-        sleep(20)
+        Follow.objects.create(user=self.user, author=self.author_1)
+        response = self.authorized_client.get(reverse("follow_index"))
+        self.assertContains(response, self.text_1)
+
+        other_client = Client()
+        other_client.force_login(self.author_1)
+        response = other_client.get(reverse("follow_index"))
+        self.assertNotContains(response, self.text_1)
 
         response = self.authorized_client.get(reverse("index"))
-        self.assertContains(response, "not_cached")
+        self.assertContains(response, "Редактировать")
+        response = self.unauthorized_client.get(reverse("index"))
+        self.assertNotContains(response, "Редактировать")
 
     def test_auth_user_follow(self):
         """
@@ -347,3 +428,1864 @@ class PostAppTest(TestCase):
             follow=True,
         )
         self.assertNotContains(response, self.comment_text)
+
+
+class CursorPaginationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="cursor", password="1")
+        for i in range(25):
+            Post.objects.create(text=f"post {i}", author=self.user)
+        self.ordered = list(
+            Post.objects.order_by("-pub_date", "-pk").values_list(
+                "pk", flat=True
+            )
+        )
+
+    def walk(self, url):
+        """
+        Вспомогательная функция: проходит ленту по ссылкам «Следующая».
+        """
+
+        seen = []
+        response = self.client.get(url)
+        while True:
+            page = response.context["page"]
+            seen.extend(post.pk for post in page)
+            if not page.has_next():
+                return seen, page
+            response = self.client.get(url, {"cursor": page.next_cursor})
+
+    def test_cursor_walks_whole_feed(self):
+        """
+        Переход по курсорам выдаёт все посты по порядку и без повторов.
+        """
+
+        urls = [
+            reverse("index"),
+            reverse("profile", kwargs={"username": self.user.username}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                seen, _ = self.walk(url)
+                self.assertEqual(seen, self.ordered)
+
+    def test_cursor_previous_page(self):
+        """
+        Ссылка «Предыдущая» возвращает на предыдущую страницу.
+        """
+
+        url = reverse("index")
+        first = self.client.get(url).context["page"]
+        second = self.client.get(url, {"cursor": first.next_cursor}).context[
+            "page"
+        ]
+        third = self.client.get(url, {"cursor": second.next_cursor}).context[
+            "page"
+        ]
+        back = self.client.get(url, {"cursor": third.previous_cursor}).context[
+            "page"
+        ]
+        self.assertEqual([p.pk for p in back], [p.pk for p in second])
+        back = self.client.get(url, {"cursor": back.previous_cursor}).context[
+            "page"
+        ]
+        self.assertEqual([p.pk for p in back], self.ordered[:10])
+        self.assertFalse(back.has_previous())
+
+    def test_old_page_links_and_bad_cursor(self):
+        """
+        Старые ссылки ?page=N работают, испорченный курсор ведёт на первую
+        страницу.
+        """
+
+        url = reverse("index")
+        response = self.client.get(url, {"page": 3})
+        self.assertEqual(
+            [p.pk for p in response.context["page"]], self.ordered[20:]
+        )
+        response = self.client.get(url, {"cursor": "garbage"})
+        self.assertEqual(
+            [p.pk for p in response.context["page"]], self.ordered[:10]
+        )
+        last = Post.objects.get(pk=self.ordered[-1])
+        response = self.client.get(url, {"cursor": encode_cursor(NEXT, last)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["page"]), 0)
+
+    def test_forged_cursors(self):
+        """
+        Курсор с чужим типом ключа, недопустимым значением или id вне
+        диапазона базы ведёт на первую страницу, а не к ошибке сервера.
+        """
+
+        post = Post.objects.get(pk=self.ordered[0])
+        created = post.pub_date.isoformat()
+        urls = [
+            (reverse("index"), {}),
+            (reverse("search"), {"q": "post"}),
+            (reverse("post_comments", args=("cursor", post.pk)), {}),
+        ]
+        for token in (
+            "n|1.5|3",
+            "n|nan|3",
+            f"n|{created}|{2 ** 64}",
+            f"n|{created}|0",
+            "n|2019-05-01T10:00:00|3",
+            "n|0001-01-01T00:00:00+05:00|3",
+            f"p|1.5|{2 ** 64}",
+        ):
+            cursor = urlsafe_base64_encode(force_bytes(token))
+            for url, params in urls:
+                with self.subTest(token=token, url=url):
+                    response = self.client.get(
+                        url, {**params, "cursor": cursor}
+                    )
+                    self.assertEqual(response.status_code, 200)
+        cache.clear()
+        response = self.client.get(
+            reverse("index"),
+            {"cursor": urlsafe_base64_encode(force_bytes("n|1.5|3"))},
+        )
+        self.assertEqual(
+            [p.pk for p in response.context["page"]], self.ordered[:10]
+        )
+
+    def test_first_page_without_count(self):
+        """
+        Первая страница ленты читается одним запросом, без COUNT(*).
+        """
+
+        url = reverse("index")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(
+            [p.pk for p in response.context["page"]], self.ordered[:10]
+        )
+        self.assertTrue(response.context["page"].has_next())
+        self.assertFalse([q for q in queries if "COUNT(" in q["sql"].upper()])
+        self.assertNotContains(response, "?page=")
+
+
+class UserStatsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="reader", password="1")
+        self.author = User.objects.create_user(username="writer", password="1")
+        self.client.force_login(self.user)
+
+    def test_counters_follow_writes(self):
+        """
+        Счётчики обновляются при создании и удалении постов и подписок.
+        """
+
+        post = Post.objects.create(text="text", author=self.author)
+        Post.objects.create(text="text", author=self.author)
+        self.client.get(
+            reverse("profile_follow", kwargs={"username": "writer"})
+        )
+        stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(
+            (stats.post_count, stats.follower_count, stats.following_count),
+            (2, 1, 0),
+        )
+        self.assertEqual(
+            UserStats.objects.get(user=self.user).following_count, 1
+        )
+
+        post.delete()
+        self.client.get(
+            reverse("profile_unfollow", kwargs={"username": "writer"})
+        )
+        stats.refresh_from_db()
+        self.assertEqual(
+            (stats.post_count, stats.follower_count, stats.following_count),
+            (1, 0, 0),
+        )
+
+    def test_counters_do_not_go_negative(self):
+        """
+        Разошедшийся счётчик при удалении не опускается ниже нуля.
+        """
+
+        post = Post.objects.create(text="text", author=self.author)
+        UserStats.objects.filter(user=self.author).update(post_count=0)
+        post.delete()
+        self.assertEqual(UserStats.objects.get(user=self.author).post_count, 0)
+
+    def test_profile_uses_stats(self):
+        """
+        Страница профиля показывает счётчики из UserStats.
+        """
+
+        Post.objects.create(text="text", author=self.author)
+        Follow.objects.create(user=self.user, author=self.author)
+        response = self.client.get(
+            reverse("profile", kwargs={"username": "writer"})
+        )
+        self.assertContains(response, "Подписчиков: 1")
+        self.assertContains(response, "Записей: 1")
+
+    def test_rebuild_command(self):
+        """
+        rebuild_user_stats исправляет расхождения счётчиков.
+        """
+
+        Post.objects.create(text="text", author=self.author)
+        UserStats.objects.filter(user=self.author).update(post_count=42)
+        UserStats.objects.filter(user=self.user).delete()
+        call_command("rebuild_user_stats", chunk_size=1, stdout=StringIO())
+        self.assertEqual(UserStats.objects.get(user=self.author).post_count, 1)
+        self.assertEqual(UserStats.objects.count(), User.objects.count())
+
+
+class FollowFeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username="reader", password="1")
+        self.author = User.objects.create_user(username="writer", password="1")
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def feed_texts(self):
+        cache.clear()
+        response = self.reader_client.get(reverse("follow_index"))
+        return [entry.post.text for entry in response.context["page"]]
+
+    def test_new_post_fans_out(self):
+        """
+        Пост, опубликованный через new_post, попадает в ленты подписчиков.
+        """
+
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.author_client.post(reverse("new_post"), {"text": "fresh"})
+        self.assertTrue(
+            FeedEntry.objects.filter(
+                user=self.reader, post__text="fresh"
+            ).exists()
+        )
+        self.assertEqual(self.feed_texts(), ["fresh"])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """
+        Подписка добавляет в ленту старые посты автора, отписка — убирает.
+        """
+
+        Post.objects.create(text="old", author=self.author)
+        self.reader_client.get(
+            reverse("profile_follow", kwargs={"username": "writer"})
+        )
+        self.assertEqual(self.feed_texts(), ["old"])
+        self.reader_client.get(
+            reverse("profile_unfollow", kwargs={"username": "writer"})
+        )
+        self.assertEqual(self.feed_texts(), [])
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_feed_cache_follows_posts(self):
+        """
+        Закешированная лента подписок зависит от области читателя и
+        обновляется при публикации, правке и удалении поста автора.
+        """
+
+        Follow.objects.create(user=self.reader, author=self.author)
+        url = reverse("follow_index")
+        response = self.reader_client.get(url)
+        self.assertEqual(
+            response.wsgi_request.cache_scopes,
+            (page_cache.user(self.reader.pk),),
+        )
+        post = Post.objects.create(text="первый", author=self.author)
+        self.assertContains(self.reader_client.get(url), "первый")
+        post.text = "исправленный"
+        post.save()
+        self.assertContains(self.reader_client.get(url), "исправленный")
+        post.delete()
+        self.assertNotContains(self.reader_client.get(url), "исправленный")
+
+    @override_settings(FEED_DEPTH=3)
+    def test_feed_trimmed_to_depth(self):
+        """
+        Лента обрезается до FEED_DEPTH последних записей.
+        """
+
+        for i in range(5):
+            Post.objects.create(text=f"post {i}", author=self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.feed_texts(), ["post 4", "post 3", "post 2"])
+
+        Post.objects.create(text="post 5", author=self.author)
+        call_command("rebuild_follow_feeds", trim_only=True, stdout=StringIO())
+        self.assertEqual(self.feed_texts(), ["post 5", "post 4", "post 3"])
+
+    @override_settings(FEED_DEPTH=3, FEED_TRIM_SAMPLE=1)
+    def test_fan_out_trims_sampled_feeds(self):
+        """
+        Рассылка поста обрезает попавшие в выборку ленты до FEED_DEPTH.
+        """
+
+        Follow.objects.create(user=self.reader, author=self.author)
+        for i in range(5):
+            Post.objects.create(text=f"post {i}", author=self.author)
+        self.assertEqual(FeedEntry.objects.filter(user=self.reader).count(), 3)
+
+
+@override_settings(FEED_PULL_THRESHOLD=1)
+class HybridTimelineTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username="reader", password="1")
+        self.other = User.objects.create_user(username="other", password="1")
+        self.star = User.objects.create_user(username="star", password="1")
+        self.author = User.objects.create_user(username="writer", password="1")
+        for user in (self.reader, self.other):
+            Follow.objects.create(user=user, author=self.star)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_popular_author_is_pulled(self):
+        """
+        Посты автора выше порога не рассылаются, но видны в ленте вместе
+        с постами обычных авторов в порядке публикации.
+        """
+
+        texts = []
+        for i in range(12):
+            author = self.star if i % 3 == 0 else self.author
+            Post.objects.create(text=f"post {i}", author=author)
+            texts.insert(0, f"post {i}")
+        self.assertFalse(FeedEntry.objects.filter(author=self.star).exists())
+
+        cache.clear()
+        url = reverse("follow_index")
+        page = self.client.get(url).context["page"]
+        seen = [entry.post.text for entry in page]
+        page = self.client.get(url, {"cursor": page.next_cursor}).context[
+            "page"
+        ]
+        seen.extend(entry.post.text for entry in page)
+        self.assertEqual(seen, texts)
+        self.assertFalse(page.has_next())
+
+        page = self.client.get(url, {"cursor": page.previous_cursor}).context[
+            "page"
+        ]
+        self.assertEqual([entry.post.text for entry in page], texts[:10])
+
+    def test_author_back_below_threshold_is_pushed(self):
+        """
+        Когда подписчиков автора снова становится не больше порога, его
+        посты, вышедшие за время чтения при открытии, раскладываются
+        по лентам и не пропадают из них.
+        """
+
+        Post.objects.create(text="pulled", author=self.star)
+        Follow.objects.filter(user=self.other).delete()
+        self.assertTrue(
+            FeedEntry.objects.filter(
+                user=self.reader, post__text="pulled"
+            ).exists()
+        )
+        Post.objects.create(text="pushed", author=self.star)
+        cache.clear()
+        page = self.client.get(reverse("follow_index")).context["page"]
+        self.assertEqual(
+            [entry.post.text for entry in page], ["pushed", "pulled"]
+        )
+
+    def test_resume_push_sends_only_new_posts(self):
+        """
+        При возврате автора под порог рассылаются только посты новее
+        последнего разложенного, а не вся глубина ленты.
+        """
+
+        Post.objects.create(text="pulled", author=self.star)
+        Follow.objects.filter(user=self.other).delete()
+        Follow.objects.create(user=self.other, author=self.star)
+        Post.objects.create(text="later", author=self.star)
+        with mock.patch("posts.feed._deliver", wraps=feed._deliver) as deliver:
+            Follow.objects.filter(user=self.other).delete()
+        delivered = [
+            entry.post.text
+            for (entries,), _ in deliver.call_args_list
+            for entry in entries
+        ]
+        self.assertEqual(delivered, ["later"])
+        self.assertEqual(
+            set(
+                FeedEntry.objects.filter(user=self.reader).values_list(
+                    "post__text", flat=True
+                )
+            ),
+            {"pulled", "later"},
+        )
+
+
+class QueryBudgetTest(TestCase):
+    # запросы сессии и пользователя для авторизованного клиента
+    auth_queries = 2
+
+    def setUp(self):
+        cache.clear()
+        self.users = [
+            User.objects.create_user(username=f"user_{i}", password="1")
+            for i in range(5)
+        ]
+        self.group = Group.objects.create(
+            title="title", slug="slug", description="description"
+        )
+        for author in self.users[1:]:
+            Follow.objects.create(user=self.users[0], author=author)
+        self.client = Client()
+        self.client.force_login(self.users[0])
+
+    def seed(self, count):
+        for i in range(count):
+            post = Post.objects.create(
+                text=f"post {i}",
+                author=self.users[i % len(self.users)],
+                group=self.group,
+            )
+            for author in self.users[:3]:
+                Comment.objects.create(post=post, author=author, text="text")
+        return post
+
+    def urls(self, post):
+        author = post.author.username
+        return [
+            reverse("index"),
+            reverse("group_posts", kwargs={"slug": self.group.slug}),
+            reverse("profile", kwargs={"username": author}),
+            reverse(
+                "post_view", kwargs={"username": author, "post_id": post.id}
+            ),
+            reverse(
+                "add_comment",
+                kwargs={"username": author, "post_id": post.id},
+            ),
+            reverse(
+                "post_comments",
+                kwargs={"username": author, "post_id": post.id},
+            ),
+            reverse("follow_index"),
+        ]
+
+    def test_views_stay_within_budget(self):
+        """
+        Число запросов каждого представления не превышает объявленного
+        бюджета и не растёт с числом постов и комментариев.
+        """
+
+        for count in (3, 25):
+            post = self.seed(count)
+            for url in self.urls(post):
+                budget = resolve(url).func.query_budget + self.auth_queries
+                with self.subTest(url=url, posts=count):
+                    cache.clear()
+                    with CaptureQueriesContext(connection) as queries:
+                        response = self.client.get(url)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertLessEqual(len(queries), budget)
+
+    @override_settings(FEED_PULL_THRESHOLD=0)
+    def test_follow_index_with_pulled_authors(self):
+        """
+        Посты всех авторов выше порога читаются одним запросом: бюджет
+        ленты подписок не зависит от их числа.
+        """
+
+        self.seed(25)
+        url = reverse("follow_index")
+        budget = resolve(url).func.query_budget + self.auth_queries
+        self.assertEqual(len(feed.pulled_authors(self.users[0])), 4)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(len(response.context["page"]), 10)
+        self.assertLessEqual(len(queries), budget)
+
+
+class PostItemCacheTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="writer", password="1")
+        self.reader = User.objects.create_user(username="reader", password="1")
+        self.posts = [
+            Post.objects.create(text=f"post {i}", author=self.author)
+            for i in range(10)
+        ]
+        cache.clear()
+
+    def test_page_is_one_multi_get(self):
+        """
+        Повторный рендер страницы из 10 постов — один get_many без
+        рендера шаблонов карточек.
+        """
+
+        render_items(self.posts, self.reader)
+        with mock.patch.object(
+            cache, "get_many", wraps=cache.get_many
+        ) as get_many, mock.patch(
+            "posts.templatetags.post_tags.render_to_string"
+        ) as render:
+            html = render_items(self.posts, self.reader)
+        get_many.assert_called_once()
+        render.assert_not_called()
+        self.assertIn("post 9", html)
+
+    def test_edit_invalidates_item(self):
+        """
+        Изменение поста меняет ключ его карточки.
+        """
+
+        post = self.posts[0]
+        render_items([post], self.reader)
+        post.text = "edited"
+        post.save()
+        self.assertIn("edited", render_items([post], self.reader))
+
+    def test_author_rename_invalidates_item(self):
+        """
+        Карточка ссылается на профиль автора: после смены имени ключ
+        карточки другой.
+        """
+
+        render_items([self.posts[0]], self.reader)
+        self.author.username = "renamed"
+        self.author.save()
+        post = Post.objects.select_related("author").get(pk=self.posts[0].pk)
+        html = render_items([post], self.reader)
+        self.assertIn(reverse("profile", args=("renamed",)), html)
+        self.assertNotIn(reverse("profile", args=("writer",)), html)
+
+    def test_edit_link_only_for_author(self):
+        """
+        Ссылка «Редактировать» добавляется только автору поста.
+        """
+
+        post = self.posts[0]
+        self.assertNotIn("Редактировать", render_items([post], self.reader))
+        self.assertIn("Редактировать", render_items([post], self.author))
+        self.assertNotIn(EDIT_LINK, render_items([post], self.author))
+
+
+class AnonymousPageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="writer", password="1")
+        self.post = Post.objects.create(text="first", author=self.author)
+        self.urls = [
+            reverse("index"),
+            reverse("profile", kwargs={"username": "writer"}),
+            reverse(
+                "post_view",
+                kwargs={"username": "writer", "post_id": self.post.pk},
+            ),
+        ]
+
+    def test_repeat_visit_without_queries(self):
+        """
+        Повторный анонимный запрос и запрос с If-None-Match обходятся
+        без базы данных.
+        """
+
+        for url in self.urls:
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                self.assertIn("ETag", first)
+                self.assertIn("Last-Modified", first)
+                self.assertIn("public", first["Cache-Control"])
+                with self.assertNumQueries(0):
+                    second = self.client.get(url)
+                self.assertEqual(second.content, first.content)
+                with self.assertNumQueries(0):
+                    response = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=first["ETag"]
+                    )
+                self.assertEqual(response.status_code, 304)
+
+    def test_write_invalidates_page(self):
+        """
+        Новый пост и комментарий сбрасывают копии зависящих страниц.
+        """
+
+        etags = {url: self.client.get(url)["ETag"] for url in self.urls}
+        Post.objects.create(text="second", author=self.author)
+        Comment.objects.create(
+            post=self.post, author=self.author, text="comment"
+        )
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response["ETag"], etags[url])
+        self.assertContains(self.client.get(self.urls[0]), "second")
+        self.assertContains(self.client.get(self.urls[2]), "comment")
+
+    def test_logged_in_user_not_served_cached_page(self):
+        """
+        Посетитель с сессией получает свою страницу, а не общую копию.
+        """
+
+        self.client.get(self.urls[0])
+        self.client.force_login(self.author)
+        response = self.client.get(self.urls[0])
+        self.assertContains(response, "Новая запись")
+        self.assertNotIn("ETag", response)
+
+
+class ConditionalPostViewTest(TestCase):
+    # запросы сессии и пользователя
+    auth_queries = 2
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="writer", password="1")
+        self.reader = User.objects.create_user(username="reader", password="1")
+        self.post = Post.objects.create(text="text", author=self.author)
+        self.url = reverse(
+            "post_view", kwargs={"username": "writer", "post_id": self.post.pk}
+        )
+        self.client.force_login(self.reader)
+
+    def test_revalidation_is_one_query(self):
+        """
+        Повторный запрос с If-None-Match — один запрос и ответ 304.
+        """
+
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertNumQueries(self.auth_queries + 1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_update_validators(self):
+        """
+        Новый комментарий и правка поста меняют ETag и Last-Modified.
+        """
+
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        Comment.objects.create(
+            post=self.post, author=self.reader, text="comment"
+        )
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "comment")
+        etag = response["ETag"]
+        self.post.text = "edited"
+        self.post.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "edited")
+
+    def test_comment_edit_and_rename_update_etag(self):
+        """
+        Правка комментария и переименование автора не меняют строк поста,
+        но меняют ETag.
+        """
+
+        comment = Comment.objects.create(
+            post=self.post, author=self.reader, text="comment"
+        )
+        etag = self.client.get(self.url)["ETag"]
+        comment.text = "corrected"
+        comment.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "corrected")
+
+        etag = response["ETag"]
+        self.author.first_name = "Писатель"
+        self.author.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_etag_differs_between_users(self):
+        """
+        Автор видит ссылку «Редактировать», поэтому ETag у него свой.
+        """
+
+        etag = self.client.get(self.url)["ETag"]
+        self.client.force_login(self.author)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "Редактировать")
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="writer", password="1")
+
+    def found(self, query, **params):
+        response = self.client.get(reverse("search"), {"q": query, **params})
+        return response.context["page"]
+
+    def texts(self, query):
+        return [post.text for post in self.found(query)]
+
+    def test_ranked_and_incremental(self):
+        """
+        Результаты упорядочены по релевантности, правка и удаление поста
+        сразу видны в поиске.
+        """
+
+        rare = Post.objects.create(
+            text="Кошка спит. " + "Слово. " * 20, author=self.author
+        )
+        Post.objects.create(text="кошка кошка кошка", author=self.author)
+        Post.objects.create(text="собака", author=self.author)
+        self.assertEqual(self.texts("КОШКА"), ["кошка кошка кошка", rare.text])
+        self.assertEqual(self.texts("кош"), self.texts("кошка"))
+
+        rare.text = "Собака спит"
+        rare.save()
+        self.assertEqual(self.texts("спит"), ["Собака спит"])
+        rare.delete()
+        self.assertEqual(self.texts("спит"), [])
+        self.assertEqual(self.texts("*** OR"), [])
+
+    def test_cursor_pagination(self):
+        """
+        Курсор проходит всю выдачу без пропусков и повторов.
+        """
+
+        for i in range(25):
+            Post.objects.create(text=f"пост {i}", author=self.author)
+        page = self.found("пост")
+        seen = [post.pk for post in page]
+        while page.has_next():
+            page = self.found("пост", cursor=page.next_cursor)
+            seen.extend(post.pk for post in page)
+        self.assertEqual(
+            sorted(seen), sorted(Post.objects.values_list("pk", flat=True))
+        )
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_like_fallback(self):
+        """
+        На СУБД без индекса сигналы его не трогают, а поиск идёт по LIKE
+        от новых постов к старым, с курсором.
+        """
+
+        with mock.patch.object(search, "VENDORS", ()):
+            posts = [
+                Post.objects.create(text=f"кошка {i}", author=self.author)
+                for i in range(12)
+            ]
+            Post.objects.create(text="собака", author=self.author)
+            page = self.found("кошка")
+            seen = [post.pk for post in page]
+            page = self.found("кошка", cursor=page.next_cursor)
+            seen.extend(post.pk for post in page)
+            self.assertFalse(page.has_next())
+        self.assertEqual(seen, [post.pk for post in reversed(posts)])
+        self.assertEqual(self.texts("кошка"), [])
+
+    def test_admin_uses_index(self):
+        """
+        Поиск в админке выдаёт то же, что и /search/.
+        """
+
+        Post.objects.create(text="найди меня", author=self.author)
+        Post.objects.create(text="другой текст", author=self.author)
+        admin = User.objects.create_superuser("admin", "a@a.ru", "1")
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse("admin:posts_post_changelist"), {"q": "найди"}
+        )
+        self.assertEqual(
+            [post.text for post in response.context["cl"].result_list],
+            ["найди меня"],
+        )
+
+    def test_rebuild_command(self):
+        """
+        rebuild_search_index индексирует посты, созданные без сигналов.
+        """
+
+        Post.objects.bulk_create(
+            [Post(text="массовая загрузка", author=self.author)]
+        )
+        self.assertEqual(self.texts("массовая"), [])
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(self.texts("массовая"), ["массовая загрузка"])
+
+
+class AdminTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser("admin", "a@a.ru", "1")
+        self.client.force_login(self.admin)
+        self.group = Group.objects.create(title="title", slug="slug")
+
+    def seed(self, count):
+        start = Post.objects.count()
+        for i in range(start, start + count):
+            author = User.objects.create_user(username=f"user_{i}")
+            post = Post.objects.create(
+                text=f"post {i}", author=author, group=self.group
+            )
+            Comment.objects.create(post=post, author=author, text="text")
+            Follow.objects.create(user=self.admin, author=author)
+
+    def test_changelists_constant_queries(self):
+        """
+        Число запросов списков не зависит от числа строк.
+        """
+
+        for model in ("post", "comment", "follow"):
+            url = reverse(f"admin:posts_{model}_changelist")
+            counts = []
+            for rows in (2, 10):
+                self.seed(rows)
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                counts.append(len(queries))
+            with self.subTest(model=model):
+                self.assertEqual(counts[0], counts[1])
+
+    def test_approximate_count(self):
+        """
+        Без фильтров большой таблицы COUNT(*) не выполняется.
+        """
+
+        self.seed(3)
+        url = reverse("admin:posts_post_changelist")
+        with mock.patch(
+            "posts.paginator.ApproximateCountPaginator.exact_count_limit", 0
+        ), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertNotIn("COUNT(", " ".join(q["sql"] for q in queries))
+        self.assertEqual(
+            response.context["cl"].result_count,
+            Post.objects.order_by("-pk").first().pk,
+        )
+        self.assertContains(response, "post 2")
+        self.assertContains(response, "toplinks")
+
+    def test_add_form_uses_autocomplete(self):
+        """
+        Форма поста не выводит всех пользователей и группы в <select>.
+        """
+
+        self.seed(3)
+        response = self.client.get(reverse("admin:posts_post_add"))
+        self.assertNotContains(response, "user_2")
+        self.assertContains(response, "admin-autocomplete")
+
+
+class ThumbnailTest(TestCase):
+    small_gif = (
+        b"\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04"
+        b"\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02"
+        b"\x02\x4c\x01\x00\x3b"
+    )
+
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.author = User.objects.create_user(username="writer", password="1")
+        self.client.force_login(self.author)
+
+    def image(self, name="small.gif"):
+        return SimpleUploadedFile(name, self.small_gif, "image/gif")
+
+    def test_generated_in_background(self):
+        """
+        Пока миниатюра не готова, выводится заглушка; после нарезки —
+        сохранённый адрес миниатюры без обращения к sorl при рендере.
+        """
+
+        with mock.patch("posts.views.thumbnails.schedule") as schedule:
+            self.client.post(
+                reverse("new_post"), {"text": "text", "image": self.image()}
+            )
+        post = Post.objects.get()
+        schedule.assert_called_once_with(post)
+        self.assertContains(self.client.get("/"), "placeholder.svg")
+
+        thumbnails.generate(post.pk)
+        post.refresh_from_db()
+        with mock.patch("sorl.thumbnail.get_thumbnail") as get_thumbnail:
+            response = self.client.get("/")
+        get_thumbnail.assert_not_called()
+        self.assertContains(response, post.thumbnail_set["src"])
+        self.assertNotContains(response, "placeholder.svg")
+
+    def test_responsive_variants(self):
+        """
+        Карточка получает srcset в WebP и JPEG по всем ширинам,
+        отложенную загрузку и встроенное превью.
+        """
+
+        post = Post.objects.create(
+            text="text", author=self.author, image=self.image()
+        )
+        thumbnails.generate(post.pk)
+        post.refresh_from_db()
+        variants = post.thumbnail_set
+        for image_format, extension in (("webp", ".webp"), ("jpeg", ".jpg")):
+            srcset = [
+                entry.split() for entry in variants[image_format].split(", ")
+            ]
+            self.assertEqual(
+                [width for _, width in srcset], ["320w", "640w", "960w"]
+            )
+            for url, _ in srcset:
+                self.assertTrue(url.endswith(extension), url)
+        self.assertTrue(variants["lqip"].startswith("data:image/jpeg;base64,"))
+        response = self.client.get("/")
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, variants["lqip"])
+
+    def test_new_image_resets_thumbnails(self):
+        """
+        Замена картинки при правке сбрасывает миниатюры и ставит нарезку.
+        """
+
+        post = Post.objects.create(
+            text="text", author=self.author, image=self.image()
+        )
+        thumbnails.generate(post.pk)
+        url = reverse(
+            "post_edit", kwargs={"username": "writer", "post_id": post.pk}
+        )
+        with mock.patch("posts.views.thumbnails.schedule") as schedule:
+            self.client.post(
+                url, {"text": "edited", "image": self.image("other.gif")}
+            )
+        post.refresh_from_db()
+        self.assertEqual(post.thumbnails, "")
+        schedule.assert_called_once()
+
+        with mock.patch("posts.views.thumbnails.schedule") as schedule:
+            self.client.post(url, {"text": "edited again"})
+        schedule.assert_not_called()
+
+    def test_prefetch_legacy_thumbnails(self):
+        """
+        Для постов без нарезанных вариантов готовые миниатюры sorl
+        достаются одним multi-get на страницу, а потом берутся из LRU.
+        """
+
+        posts = [
+            Post.objects.create(
+                text=f"text {i}", author=self.author, image=self.image()
+            )
+            for i in range(3)
+        ]
+        geometry, options = thumbnails.LEGACY_THUMBNAIL
+        legacy = [
+            get_thumbnail(post.image, geometry, **options) for post in posts
+        ]
+        thumbnails.known.clear()
+        self.addCleanup(thumbnails.known.clear)
+
+        with mock.patch(
+            "posts.thumbnails._kv_get_many", wraps=thumbnails._kv_get_many
+        ) as kv_get_many:
+            response = self.client.get("/")
+            kv_get_many.assert_called_once()
+            self.assertEqual(len(kv_get_many.call_args[0][0]), 3)
+            for thumbnail in legacy:
+                self.assertContains(response, thumbnail.url)
+            self.assertNotContains(response, "placeholder.svg")
+
+            kv_get_many.reset_mock()
+            fresh = list(Post.objects.all())
+            thumbnails.prefetch(fresh)
+            kv_get_many.assert_not_called()
+        self.assertEqual(fresh[0].thumbnail_set["width"], 960)
+
+
+class ImageUploadTest(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(
+            MEDIA_ROOT=media.name, THUMBNAIL_WORKERS=0
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.author = User.objects.create_user(username="writer", password="1")
+        self.client.force_login(self.author)
+
+    def photo(self, size=(300, 200), orientation=6):
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        exif[0x010F] = "Camera"
+        buffer = BytesIO()
+        Image.new("RGB", size, "red").save(buffer, "JPEG", exif=exif.tobytes())
+        return SimpleUploadedFile("photo.jpeg", buffer.getvalue())
+
+    @override_settings(POST_IMAGE_MASTER_SIZE=100)
+    def test_rotated_downscaled_and_stripped(self):
+        """
+        Загруженное фото повёрнуто по EXIF, уменьшено до мастер-размера
+        и сохранено без метаданных.
+        """
+
+        self.client.post(
+            reverse("new_post"), {"text": "text", "image": self.photo()}
+        )
+        post = Post.objects.get()
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (67, 100))
+            self.assertEqual(len(image.getexif()), 0)
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=50000)
+    def test_too_many_pixels_rejected_before_decoding(self):
+        """
+        Слишком большое по пикселям изображение отклоняется по заголовку.
+        """
+
+        with mock.patch("PIL.ImageFile.ImageFile.load") as load:
+            response = self.client.post(
+                reverse("new_post"), {"text": "text", "image": self.photo()}
+            )
+        load.assert_not_called()
+        self.assertFormError(
+            response, "form", "image", "Изображение больше 0.05 Мп."
+        )
+        self.assertFalse(Post.objects.exists())
+
+    def test_truncated_jpeg_rejected(self):
+        """
+        Обрезанный JPEG отклоняется ошибкой формы, а не падением сервера.
+        """
+
+        photo = self.photo(size=(800, 600)).read()
+        truncated = SimpleUploadedFile("photo.jpeg", photo[: len(photo) // 2])
+        response = self.client.post(
+            reverse("new_post"), {"text": "text", "image": truncated}
+        )
+        self.assertFormError(
+            response, "form", "image", "Не удалось прочитать изображение."
+        )
+        self.assertFalse(Post.objects.exists())
+
+
+class CommentPaginationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="writer", password="1")
+        self.post = Post.objects.create(text="text", author=self.author)
+        self.readers = [
+            User.objects.create_user(username=f"reader_{i}", password="1")
+            for i in range(3)
+        ]
+        self.comments = [
+            Comment.objects.create(
+                post=self.post,
+                author=self.readers[i % len(self.readers)],
+                text=f"comment {i}",
+            )
+            for i in range(25)
+        ]
+        self.kwargs = {"username": "writer", "post_id": self.post.pk}
+
+    @override_settings(COMMENTS_PER_PAGE=10)
+    def test_load_more(self):
+        """
+        Страница поста выводит первую порцию комментариев по порядку
+        создания, а «Показать ещё» отдаёт только следующую.
+        """
+
+        response = self.client.get(reverse("post_view", kwargs=self.kwargs))
+        page = response.context["comment_page"]
+        self.assertEqual(list(page), self.comments[:10])
+        self.assertNotContains(response, "comment 10<")
+
+        url = reverse("post_comments", kwargs=self.kwargs)
+        seen = list(page)
+        while page.next_cursor:
+            response = self.client.get(url, {"cursor": page.next_cursor})
+            self.assertNotContains(response, "<html")
+            page = response.context["comment_page"]
+            seen.extend(page)
+        self.assertEqual(seen, self.comments)
+        self.assertNotContains(response, "js-more-comments")
+
+    def test_comments_of_other_author(self):
+        url = reverse(
+            "post_comments",
+            kwargs={"username": "reader_0", "post_id": self.post.pk},
+        )
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class CommentCountTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="writer", password="1")
+        self.reader = User.objects.create_user(username="reader", password="1")
+        self.client.force_login(self.reader)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.posts = [
+            Post.objects.create(text=f"post {i}", author=self.author)
+            for i in range(5)
+        ]
+
+    def comment(self, post):
+        return Comment.objects.create(
+            post=post, author=self.reader, text="text"
+        )
+
+    def test_counter_follows_comments(self):
+        """
+        Счётчик растёт и уменьшается вместе с комментариями, а страница
+        поста и ленты сразу показывают новое число.
+        """
+
+        post = self.posts[0]
+        url = reverse(
+            "post_view", kwargs={"username": "writer", "post_id": post.pk}
+        )
+        self.assertContains(self.client.get(url), "Комментариев: 0")
+        comments = [self.comment(post) for _ in range(3)]
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 3)
+        self.assertContains(self.client.get(url), "Комментариев: 3")
+
+        comments[0].delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 2)
+        self.assertContains(self.client.get(url), "Комментариев: 2")
+        self.assertContains(self.client.get("/"), "Комментариев: 2")
+
+        post.delete()
+        self.assertFalse(Comment.objects.exists())
+
+    def test_comments_reset_feeds(self):
+        """
+        Комментарий сбрасывает кеш лент, где показан его пост, вместе с
+        анонимными страницами: число комментариев в них не устаревает.
+        """
+
+        post = self.posts[0]
+        post.group = Group.objects.create(title="cats", slug="cats")
+        post.save()
+        anonymous = Client()
+        pages = [
+            (client, url)
+            for client in (self.client, anonymous)
+            for url in (
+                "/",
+                reverse("group_posts", kwargs={"slug": "cats"}),
+                reverse("profile", kwargs={"username": "writer"}),
+            )
+        ]
+        pages.append((self.client, reverse("follow_index")))
+
+        def assert_count(count):
+            for client, url in pages:
+                with self.subTest(url=url, anonymous=client is anonymous):
+                    self.assertContains(
+                        client.get(url), f"Комментариев: {count}"
+                    )
+
+        assert_count(0)
+        comment = self.comment(Post.objects.get(pk=post.pk))
+        assert_count(1)
+        Comment.objects.get(pk=comment.pk).delete()
+        assert_count(0)
+
+    def test_post_delete_skips_cascaded_comments(self):
+        """
+        Удаление поста не обрабатывает его комментарии по одному: число
+        запросов не зависит от числа комментариев.
+        """
+
+        def delete_queries(post):
+            with CaptureQueriesContext(connection) as queries:
+                post.delete()
+            return len(queries)
+
+        self.comment(self.posts[0])
+        for _ in range(10):
+            self.comment(self.posts[1])
+        self.assertEqual(
+            delete_queries(self.posts[1]), delete_queries(self.posts[0])
+        )
+        self.assertFalse(signals.deleting_posts())
+
+    def test_feed_queries_do_not_depend_on_comments(self):
+        """
+        Число запросов лент одно и то же с комментариями и без них.
+        """
+
+        urls = [
+            reverse("index"),
+            reverse("profile", kwargs={"username": "writer"}),
+            reverse("follow_index"),
+        ]
+
+        def count_queries():
+            counts = []
+            for url in urls:
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.get(url)
+                counts.append(len(queries))
+            return counts
+
+        before = count_queries()
+        for post in self.posts:
+            for _ in range(3):
+                self.comment(post)
+        self.assertEqual(count_queries(), before)
+
+    def test_reconcile_command(self):
+        """
+        reconcile_comment_counts исправляет разошедшиеся счётчики.
+        """
+
+        self.comment(self.posts[0])
+        Post.objects.filter(pk=self.posts[0].pk).update(comment_count=0)
+        Post.objects.filter(pk=self.posts[1].pk).update(comment_count=7)
+        out = StringIO()
+        call_command("reconcile_comment_counts", chunk_size=2, stdout=out)
+        self.assertEqual(
+            dict(Post.objects.values_list("pk", "comment_count")),
+            {post.pk: int(post == self.posts[0]) for post in self.posts},
+        )
+        self.assertIn("исправлено: 2", out.getvalue())
+
+
+class FollowGraphTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username="reader", password="1")
+        self.authors = [
+            User.objects.create_user(username=f"author_{i}", password="1")
+            for i in range(6)
+        ]
+        for author in self.authors[::2]:
+            Follow.objects.create(user=self.reader, author=author)
+        self.client.force_login(self.reader)
+
+    def test_unique_follow(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(user=self.reader, author=self.authors[0])
+        self.client.get(
+            reverse("profile_follow", kwargs={"username": "author_0"})
+        )
+        self.assertEqual(
+            Follow.objects.filter(author=self.authors[0]).count(), 1
+        )
+
+    def test_profile_follow_button(self):
+        for author, text in (
+            (self.authors[0], "Отписаться"),
+            (self.authors[1], "Подписаться"),
+        ):
+            response = self.client.get(
+                reverse("profile", kwargs={"username": author.username})
+            )
+            self.assertContains(response, text)
+
+
+class SuggestionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = {
+            name: User.objects.create_user(username=name, password="1")
+            for name in ("reader", "friend_1", "friend_2", "popular", "other")
+        }
+        for user, author in (
+            ("reader", "friend_1"),
+            ("reader", "friend_2"),
+            ("friend_1", "popular"),
+            ("friend_2", "popular"),
+            ("friend_2", "other"),
+            ("friend_1", "reader"),
+        ):
+            Follow.objects.create(
+                user=self.users[user], author=self.users[author]
+            )
+        self.reader = self.users["reader"]
+        self.client.force_login(self.reader)
+
+    def suggested(self, user):
+        return [
+            (suggestion.candidate.username, suggestion.mutual)
+            for suggestion in suggestions.for_user(user)
+        ]
+
+    def test_friends_of_friends(self):
+        """
+        Подсказки — авторы из подписок подписок, без самого пользователя
+        и уже отслеживаемых, по числу общих подписок.
+        """
+
+        suggestions.compute([self.reader.pk])
+        self.assertEqual(
+            self.suggested(self.reader), [("popular", 2), ("other", 1)]
+        )
+
+    def test_activity_breaks_ties(self):
+        Post.objects.create(text="text", author=self.users["other"])
+        Follow.objects.create(
+            user=self.users["friend_1"], author=self.users["other"]
+        )
+        suggestions.compute([self.reader.pk])
+        self.assertEqual(
+            self.suggested(self.reader), [("other", 2), ("popular", 2)]
+        )
+
+    def test_refreshed_on_follow(self):
+        """
+        Подписка убирает автора из подсказок и пересчитывает общие
+        подписки у подписчиков пользователя.
+        """
+
+        call_command("compute_suggestions", chunk_size=2, stdout=StringIO())
+        friend_1 = self.users["friend_1"]
+        self.assertEqual(self.suggested(friend_1), [("friend_2", 1)])
+
+        self.client.get(
+            reverse("profile_follow", kwargs={"username": "other"})
+        )
+        self.assertEqual(self.suggested(self.reader), [("popular", 2)])
+
+        Follow.objects.filter(
+            user=self.reader, author=self.users["friend_2"]
+        ).delete()
+        self.assertEqual(self.suggested(friend_1), [])
+
+    def test_panel(self):
+        suggestions.compute([self.reader.pk])
+        for url in (
+            reverse("follow_index"),
+            reverse("profile", kwargs={"username": "friend_1"}),
+        ):
+            response = self.client.get(url)
+            self.assertContains(response, "На кого подписаться")
+            self.assertContains(
+                response, reverse("profile_follow", args=["popular"])
+            )
+
+
+class QueryPlanTest(TestCase):
+    def test_views_use_indexes(self):
+        """
+        Ни один запрос страниц не читает таблицу целиком и не сортирует
+        строки без индекса.
+        """
+
+        out = StringIO()
+        call_command("check_query_plans", stdout=out)
+        self.assertIn("Все запросы идут по индексам.", out.getvalue())
+        self.assertFalse(User.objects.exists())
+
+    def test_full_scan_detected(self):
+        """
+        COUNT(*) по всей таблице читает покрывающий индекс целиком и
+        считается проблемой, как и обычный SCAN.
+        """
+
+        command = CheckQueryPlans()
+        command.tables = set(connection.introspection.table_names())
+        for sql, params in (
+            ('SELECT COUNT(*) FROM "posts_post"', []),
+            ('SELECT * FROM "posts_post" WHERE "text" = %s', ["text"]),
+        ):
+            with self.subTest(sql=sql):
+                self.assertTrue(command.problems(sql, params))
+        self.assertFalse(
+            command.problems(
+                'SELECT * FROM "posts_post" WHERE "author_id" = %s', [1]
+            )
+        )
+
+
+class ReplicaRouterTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch("yatube.db.replicas", return_value=["replica"])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = db.ReplicaRouter()
+        self.author = User.objects.create_user(username="writer", password="1")
+        db.set_pinned(False)
+
+    def test_routing(self):
+        """
+        С реплик читают только отмеченные представления и только пока
+        в запросе не было записи.
+        """
+
+        self.assertEqual(self.router.db_for_read(Post), "default")
+        with db.replica_reads():
+            self.assertEqual(self.router.db_for_read(Post), "replica")
+            self.assertEqual(self.router.db_for_write(Post), "default")
+            self.assertEqual(self.router.db_for_read(Post), "default")
+        self.assertFalse(self.router.allow_migrate("replica", "posts"))
+
+    def test_reads_own_writes(self):
+        """
+        После записи клиент получает cookie и читает из основной базы.
+        """
+
+        self.client.force_login(self.author)
+        with mock.patch("posts.views.thumbnails.schedule"):
+            response = self.client.post(reverse("new_post"), {"text": "text"})
+        self.assertIn(db.PIN_COOKIE, response.cookies)
+
+        routed = []
+        read = db.ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            # В тестах реплики нет: решение записываем, читаем из default.
+            routed.append(read(router, model, **hints))
+            return "default"
+
+        # В тестах реплики нет: проверять её соединение нечего.
+        with mock.patch.object(
+            db.ReplicaRouter, "db_for_read", record
+        ), mock.patch("yatube.db.checkout", side_effect=lambda alias: alias):
+            self.client.get("/")
+            self.assertEqual(set(routed), {"default"})
+            routed.clear()
+            self.client.cookies.pop(db.PIN_COOKIE)
+            self.client.get("/")
+            self.assertIn("replica", routed)
+
+    def test_lagging_replica_does_not_fill_cache(self):
+        """
+        Анонимная страница для общего кеша рендерится из основной базы,
+        а фрагменты, прочитанные с реплики сразу после смены поколения,
+        не кешируются: реплика могла ещё не увидеть изменение.
+        """
+
+        routed = []
+        read = db.ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            # Отстающая реплика: решение записываем, читаем из default.
+            routed.append(read(router, model, **hints))
+            return "default"
+
+        Post.objects.create(text="new", author=self.author)
+        db.set_pinned(False)
+        reader = Client()
+        reader.force_login(
+            User.objects.create_user(username="reader", password="1")
+        )
+        with mock.patch.object(
+            db.ReplicaRouter, "db_for_read", record
+        ), mock.patch("yatube.db.checkout", side_effect=lambda alias: alias):
+            self.assertContains(Client().get("/"), "new")
+            self.assertEqual(set(routed), {"default"})
+
+            routed.clear()
+            response = reader.get("/")
+            self.assertIn("replica", routed)
+            self.assertEqual(response.context["cache_timeout"], 0)
+
+            later = time.time() + settings.REPLICA_PIN_SECONDS + 1
+            with mock.patch("posts.cache.time.time", return_value=later):
+                response = reader.get("/")
+            self.assertEqual(
+                response.context["cache_timeout"],
+                settings.FRAGMENT_CACHE_TIMEOUT,
+            )
+
+    def test_one_replica_per_request(self):
+        with mock.patch(
+            "yatube.db.replicas", return_value=["replica", "replica_2"]
+        ), db.replica_reads():
+            chosen = {self.router.db_for_read(Post) for _ in range(20)}
+        self.assertEqual(len(chosen), 1)
+
+    @override_settings(DATABASE_HEALTH_CHECKS=True)
+    def test_checks_only_used_connections(self):
+        """
+        Соединение проверяется один раз при первом обращении запроса к
+        базе; запрос, не обращавшийся к базе, ничего не проверяет.
+        """
+
+        with mock.patch(
+            "yatube.db.replicas", return_value=[]
+        ), mock.patch.object(
+            type(db.connections["default"]), "is_usable", return_value=True
+        ) as is_usable:
+            self.client.get("/")
+            self.assertEqual(is_usable.call_count, 1)
+            # Анонимная страница теперь отдаётся из кеша, без базы.
+            self.client.get("/")
+            self.assertEqual(is_usable.call_count, 1)
+
+
+class TunedSQLiteTest(SimpleTestCase):
+    def test_pragmas_and_immediate_transactions(self):
+        """
+        Соединение получает PRAGMA профиля, а транзакция сразу берёт
+        блокировку на запись.
+        """
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "db.sqlite3")
+        wrapper = TunedSQLiteWrapper(
+            {
+                **connection.settings_dict,
+                "NAME": path,
+                "OPTIONS": {
+                    "PRAGMAS": {
+                        "journal_mode": "WAL",
+                        "synchronous": "NORMAL",
+                        "busy_timeout": 5000,
+                    },
+                    "TRANSACTION_MODE": "IMMEDIATE",
+                },
+            }
+        )
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            for name, value in (
+                ("journal_mode", "wal"),
+                ("synchronous", 1),
+                ("busy_timeout", 5000),
+            ):
+                cursor.execute(f"PRAGMA {name}")
+                self.assertEqual(cursor.fetchone()[0], value)
+
+        wrapper._start_transaction_under_autocommit()
+        other = sqlite3.connect(path, timeout=0)
+        self.addCleanup(other.close)
+        with self.assertRaisesMessage(
+            sqlite3.OperationalError, "database is locked"
+        ):
+            other.execute("BEGIN IMMEDIATE")
+        wrapper.connection.rollback()
+
+
+class ImportContentTest(TestCase):
+    records = [
+        {"type": "group", "slug": "cats", "title": "Cats"},
+        {
+            "type": "post",
+            "id": 501,
+            "author": "writer",
+            "text": "first cat",
+            "group": "cats",
+            "pub_date": "2019-05-01T10:00:00+00:00",
+        },
+        {"type": "post", "id": 502, "author": "writer", "text": "second"},
+        {
+            "type": "comment",
+            "post": 501,
+            "author": "reader",
+            "text": "nice",
+            "created": "2019-05-02T10:00:00+00:00",
+        },
+        {"type": "comment", "post": 502, "author": "reader", "text": "ok"},
+        {"type": "follow", "user": "reader", "author": "writer"},
+        {"type": "follow", "user": "reader", "author": "writer"},
+    ]
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        User.objects.create_user(username="writer", password="1")
+
+    def write(self, name, lines):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8", newline="") as output:
+            output.writelines(lines)
+        return path
+
+    def assert_imported(self):
+        first = Post.objects.get(pk=501)
+        self.assertEqual(first.group.slug, "cats")
+        self.assertEqual(first.pub_date.year, 2019)
+        self.assertEqual(first.comment_count, 1)
+        self.assertEqual(
+            Comment.objects.get(post=first).created.isoformat(),
+            "2019-05-02T10:00:00+00:00",
+        )
+        reader = User.objects.get(username="reader")
+        self.assertFalse(reader.has_usable_password())
+        self.assertEqual(Follow.objects.get(user=reader).author, first.author)
+        self.assertEqual(
+            UserStats.objects.get(user=first.author).post_count, 2
+        )
+        self.assertEqual(FeedEntry.objects.filter(user=reader).count(), 2)
+        response = self.client.get(reverse("search"), {"q": "cat"})
+        self.assertEqual(list(response.context["page"]), [first])
+
+    def test_jsonl(self):
+        """
+        Пачки bulk_create сохраняют даты из файла, связывают записи по
+        именам и slug, а в конце пересобираются счётчики и ленты.
+        """
+
+        path = self.write(
+            "content.jsonl",
+            [json.dumps(record) + "\n" for record in self.records],
+        )
+        call_command("import_content", path, batch_size=2, stdout=StringIO())
+        self.assert_imported()
+        writer = User.objects.get(username="writer")
+        self.assertEqual(
+            Post.objects.create(text="new", author=writer).pk, 503
+        )
+
+    def test_csv(self):
+        path = os.path.join(self.directory, "content.csv")
+        columns = sorted({key for record in self.records for key in record})
+        with open(path, "w", encoding="utf-8", newline="") as output:
+            writer = csv.DictWriter(output, columns)
+            writer.writeheader()
+            writer.writerows(self.records)
+        call_command("import_content", path, stdout=StringIO())
+        self.assert_imported()
+
+    def test_unknown_group(self):
+        path = self.write(
+            "content.jsonl",
+            [
+                json.dumps(
+                    {
+                        "type": "post",
+                        "author": "writer",
+                        "text": "text",
+                        "group": "missing",
+                    }
+                )
+            ],
+        )
+        with self.assertRaises(CommandError):
+            call_command("import_content", path, stdout=StringIO())
+        self.assertFalse(Post.objects.exists())
+
+    def test_malformed_lines(self):
+        """
+        Неверный JSON и строка не с объектом дают ошибку команды с
+        номером строки, а не трассировку.
+        """
+
+        group = json.dumps(self.records[0]) + "\n"
+        for line, message in (
+            ("{not json", "Строка 3: неверный JSON"),
+            ("[1, 2]", "Строка 3: ожидался объект JSON"),
+        ):
+            with self.subTest(line=line):
+                path = self.write("content.jsonl", [group, "\n", line])
+                with self.assertRaisesMessage(CommandError, message):
+                    call_command("import_content", path, stdout=StringIO())
+
+    def test_taken_ids(self):
+        """
+        Пост с id, уже занятым в базе, записывается под новым id, и
+        комментарии из файла идут к нему, а не к чужому посту.
+        """
+
+        alice = User.objects.create_user(username="alice", password="1")
+        existing = Post.objects.create(text="alice", author=alice)
+        own = Comment.objects.create(post=existing, author=alice, text="own")
+        path = self.write(
+            "content.jsonl",
+            [
+                json.dumps(record) + "\n"
+                for record in (
+                    {
+                        "type": "post",
+                        "id": existing.pk,
+                        "author": "carol",
+                        "text": "carol",
+                    },
+                    {
+                        "type": "comment",
+                        "id": own.pk,
+                        "post": existing.pk,
+                        "author": "dave",
+                        "text": "reply",
+                    },
+                    {"type": "follow", "user": "dave", "author": "carol"},
+                )
+            ],
+        )
+        output = StringIO()
+        call_command("import_content", path, skip_rebuild=True, stdout=output)
+        carol = Post.objects.get(author__username="carol")
+        self.assertNotEqual(carol.pk, existing.pk)
+        self.assertEqual(carol.comments.get().text, "reply")
+        self.assertEqual(existing.comments.get().text, "own")
+        self.assertIn("post: 1, comment: 1, follow: 1", output.getvalue())
+        self.assertIn(
+            "Постов с занятым id загружено под новым id: 1", output.getvalue()
+        )
+        self.assertIn("Комментариев с занятым id", output.getvalue())
+
+        output = StringIO()
+        call_command("import_content", path, skip_rebuild=True, stdout=output)
+        self.assertEqual(
+            Post.objects.filter(author__username="carol").count(), 2
+        )
+        self.assertIn("follow: 0", output.getvalue())
+
+
+class ExportContentTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="writer", password="1")
+        self.reader = User.objects.create_user(username="reader", password="1")
+        group = Group.objects.create(
+            title="title", slug="cats", description="description"
+        )
+        self.posts = [
+            Post.objects.create(
+                text=f"пост {i}", author=self.author, group=group
+            )
+            for i in range(3)
+        ]
+        Comment.objects.create(
+            post=self.posts[0], author=self.author, text="свой"
+        )
+        Comment.objects.create(
+            post=self.posts[0], author=self.reader, text="чужой"
+        )
+        self.url = reverse("profile_export", kwargs={"username": "writer"})
+
+    def test_streams_jsonl(self):
+        """
+        Выгрузка отдаётся потоком: посты и комментарии автора, по одной
+        записи JSON на строку.
+        """
+
+        self.client.force_login(self.author)
+        response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        self.assertIn("writer.jsonl", response["Content-Disposition"])
+        content = b"".join(response.streaming_content).decode()
+        records = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(records[0]["type"], "group")
+        self.assertEqual(
+            [(record["type"], record["text"]) for record in records[1:]],
+            [("post", post.text) for post in self.posts]
+            + [("comment", "свой")],
+        )
+        self.assertEqual(records[1]["group"], "cats")
+
+    def test_csv_and_access(self):
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+        self.client.force_login(self.author)
+        response = self.client.get(self.url, {"format": "csv"})
+        content = b"".join(response.streaming_content).decode()
+        rows = list(csv.DictReader(content.splitlines()))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[-1]["post"], str(self.posts[0].pk))
+
+    def test_command_round_trip(self):
+        """
+        Файл команды export_content загружается import_content в пустую
+        базу; комментарии к чужим постам пропускаются с отчётом.
+        """
+
+        Comment.objects.create(
+            post=Post.objects.create(text="чужой пост", author=self.reader),
+            author=self.author,
+            text="под чужим постом",
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "writer.jsonl")
+        call_command("export_content", "writer", output=path)
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        self.assertFalse(Post.objects.exists())
+        output = StringIO()
+        call_command("import_content", path, stdout=output)
+        self.assertIn("отсутствующим постам: 1", output.getvalue())
+        self.assertEqual(
+            sorted(Post.objects.values_list("pk", "text", "group__slug")),
+            sorted((post.pk, post.text, "cats") for post in self.posts),
+        )
+        self.assertEqual(Group.objects.get().description, "description")
+        self.assertEqual(Comment.objects.get().text, "свой")
+        self.assertEqual(
+            Post.objects.get(pk=self.posts[0].pk).comment_count, 1
+        )
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cache.sqlite3")
+
+    def backend(self, **options):
+        options.setdefault("CULL_EVERY", 1)
+        return SQLiteCache(self.path, {"OPTIONS": options})
+
+    def test_shared_between_workers(self):
+        """
+        Запись и удаление видны другому экземпляру бэкенда (воркеру),
+        открывшему тот же файл.
+        """
+
+        first, second = self.backend(), self.backend()
+        first.set_many({"a": 1, "b": [2]})
+        self.assertEqual(second.get_many(["a", "b", "c"]), {"a": 1, "b": [2]})
+        self.assertFalse(second.add("a", 3))
+        self.assertEqual(second.incr("a", 10), 11)
+        second.delete("b")
+        self.assertEqual(first.get("a"), 11)
+        self.assertIsNone(first.get("b"))
+
+    def test_expired_entries_are_misses(self):
+        """
+        Просроченная запись не возвращается и не мешает add().
+        """
+
+        backend = self.backend()
+        backend.set("key", "value", timeout=0)
+        self.assertIsNone(backend.get("key"))
+        self.assertFalse(backend.has_key("key"))
+        self.assertTrue(backend.add("key", "fresh"))
+        self.assertEqual(backend.get("key"), "fresh")
+
+    def test_culls_least_recently_used(self):
+        """
+        При превышении MAX_ENTRIES вытесняются давно не читанные записи.
+        """
+
+        backend = self.backend(
+            MAX_ENTRIES=4, CULL_FREQUENCY=100, TOUCH_RESOLUTION=0
+        )
+        with mock.patch("time.time", side_effect=range(100, 200)):
+            for key in "abcd":
+                backend.set(key, key, timeout=None)
+            backend.get("a")
+            backend.set("e", "e", timeout=None)
+        self.assertEqual(
+            backend.get_many("abcde"), {"a": "a", "c": "c", "d": "d", "e": "e"}
+        )
+
+    def test_size_bound(self):
+        """
+        Суммарный объём значений держится в пределах MAX_SIZE.
+        """
+
+        backend = self.backend(MAX_SIZE=10000, CULL_FREQUENCY=10)
+        for i in range(50):
+            backend.set(f"key-{i}", "x" * 1000)
+        size = backend._db.execute("SELECT sum(size) FROM cache").fetchone()[0]
+        self.assertLessEqual(size, 10000)
+        self.assertIsNotNone(backend.get("key-49"))
+        self.assertIsNone(backend.get("key-0"))
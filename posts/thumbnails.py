@@ -0,0 +1,218 @@
+"""
+Фоновая нарезка миниатюр изображений постов.
+
+Представления ставят задачу после коммита транзакции, задачи выполняет
+пул потоков воркера. Готовые адреса сохраняются в Post.thumbnails, и
+шаблоны не обращаются к sorl при рендере.
+"""
+
+import base64
+import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDBStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import cache, feed
+from .models import Post
+from .signals import post_scopes
+
+logger = logging.getLogger(__name__)
+
+# Миниатюра, которую шаблон карточки заказывал у sorl до фоновой нарезки.
+LEGACY_THUMBNAIL = ("960x339", {"crop": "center", "upscale": True})
+
+_executor = None
+_lock = threading.Lock()
+
+
+class LRU:
+    """Потокобезопасный словарь на maxsize записей с вытеснением LRU."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._data:
+                    self._data.move_to_end(key)
+                    found[key] = self._data[key]
+        return found
+
+    def set_many(self, mapping):
+        with self._lock:
+            self._data.update(mapping)
+            for key in mapping:
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+known = LRU(settings.THUMBNAIL_LRU_SIZE)
+
+
+def executor():
+    # Пул создаётся лениво, уже в процессе воркера после fork.
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix="thumbnails",
+            )
+    return _executor
+
+
+def _geometry(width):
+    aspect_width, aspect_height = settings.THUMBNAIL_ASPECT
+    return f"{width}x{max(1, round(width * aspect_height / aspect_width))}"
+
+
+def lqip(image):
+    """Крошечное превью картинки в виде data: URI для вставки в страницу."""
+    preview = get_thumbnail(
+        image,
+        _geometry(settings.THUMBNAIL_LQIP_WIDTH),
+        crop="center",
+        format="JPEG",
+        quality=40,
+    )
+    data = base64.b64encode(preview.read()).decode()
+    return f"data:image/jpeg;base64,{data}"
+
+
+def variants(image):
+    """
+    Все варианты картинки: srcset для каждого формата из
+    THUMBNAIL_FORMATS, запасной src в JPEG, размеры и LQIP.
+    """
+    width, height = settings.THUMBNAIL_ASPECT
+    result = {"width": width, "height": height, "lqip": lqip(image)}
+    for image_format in settings.THUMBNAIL_FORMATS:
+        srcset = []
+        for size in sorted(settings.THUMBNAIL_WIDTHS):
+            thumbnail = get_thumbnail(
+                image,
+                _geometry(size),
+                crop="center",
+                upscale=True,
+                format=image_format,
+            )
+            srcset.append(f"{thumbnail.url} {size}w")
+        result[image_format.lower()] = ", ".join(srcset)
+        if image_format == "JPEG":
+            result["src"] = thumbnail.url
+    return result
+
+
+def generate(post_id):
+    """Нарезает варианты картинки поста и сохраняет их в посте."""
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None or not post.image:
+        return
+    thumbnails = variants(post.image)
+    # Картинку могли заменить, пока шла нарезка: тогда результат не нужен.
+    updated = Post.objects.filter(pk=post_id, image=post.image.name).update(
+        thumbnails=json.dumps(thumbnails), updated=timezone.now()
+    )
+    if updated:
+        cache.bump(*post_scopes(post))
+        feed.bump_followers(post.author_id)
+
+
+def _kv_key(image):
+    """Ключ миниатюры LEGACY_THUMBNAIL в KV store sorl, как у get_thumbnail."""
+    backend = default.backend
+    geometry, options = LEGACY_THUMBNAIL
+    options = dict(options)
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(ImageFile(image), geometry, options)
+    return add_prefix(ImageFile(name, default.storage).key)
+
+
+def _kv_get_many(keys):
+    """Значения ключей KV store sorl: один get_many в кеш и один запрос."""
+    kvstore = default.kvstore
+    if isinstance(kvstore, CachedDBStore):
+        values = kvstore.cache.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            values.update(
+                KVStoreModel.objects.filter(key__in=missing).values_list(
+                    "key", "value"
+                )
+            )
+    else:
+        values = {key: kvstore._get_raw(key) for key in keys}
+    found = {}
+    for key, value in values.items():
+        # cached_db хранит в кеше и отметку «нет такого ключа».
+        if isinstance(value, str):
+            thumbnail = deserialize_image_file(value)
+            found[key] = {
+                "src": thumbnail.url,
+                "width": thumbnail.width,
+                "height": thumbnail.height,
+            }
+    return found
+
+
+def prefetch(posts):
+    """
+    Находит миниатюры для постов страницы, варианты которых ещё не
+    нарезаны: уже готовые у sorl достаются одним multi-get в KV store,
+    а найденные запоминаются в LRU процесса.
+    """
+    pending = {}
+    for post in posts:
+        if post.image and not post.thumbnails:
+            pending.setdefault(_kv_key(post.image), []).append(post)
+    if not pending:
+        return
+    found = known.get_many(pending)
+    missing = [key for key in pending if key not in found]
+    if missing:
+        fetched = _kv_get_many(missing)
+        known.set_many(fetched)
+        found.update(fetched)
+    for key, thumbnail in found.items():
+        for post in pending[key]:
+            post.thumbnail_set = thumbnail
+
+
+def _run(post_id):
+    try:
+        generate(post_id)
+    except Exception:
+        logger.exception("Thumbnail generation failed for post %s", post_id)
+    finally:
+        close_old_connections()
+
+
+def schedule(post):
+    """Ставит нарезку миниатюр поста в очередь после коммита."""
+    if not post.image:
+        return
+    post_id = post.pk
+    if settings.THUMBNAIL_WORKERS:
+        transaction.on_commit(lambda: executor().submit(_run, post_id))
+    else:
+        transaction.on_commit(lambda: generate(post_id))
@@ -7,8 +7,14 @@ urlpatterns = [
     path("follow/", views.follow_index, name="follow_index"),
     path("group/<slug:slug>/", views.group_posts, name="group_posts"),
     path("new/", views.new_post, name="new_post"),
+    path("search/", views.search, name="search"),
     path("<str:username>/", views.profile, name="profile"),
     path("<str:username>/<int:post_id>/", views.post_view, name="post_view"),
+    path(
+        "<str:username>/<int:post_id>/comments/",
+        views.post_comments,
+        name="post_comments",
+    ),
     path(
         "<str:username>/<int:post_id>/comment/",
         views.add_comment,
@@ -25,4 +31,9 @@ urlpatterns = [
         views.profile_unfollow,
         name="profile_unfollow",
     ),
+    path(
+        "<str:username>/export/",
+        views.profile_export,
+        name="profile_export",
+    ),
 ]
@@ -1,36 +1,77 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.core.exceptions import PermissionDenied
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+from django.views.decorators.http import condition
 
+from . import cache, export, suggestions, thumbnails
+from .cache import fragment_context
+from .conditional import post_etag, post_last_modified
+from .decorators import (
+    cache_anonymous_page,
+    query_budget,
+    read_from_replica,
+)
+from .feed import pulled_authors, timeline
+from .follows import with_following
 from .forms import CommentForm, PostForm
 from .models import Follow, Group, Post, User
+from .paginator import CursorPaginator, paginate, paginate_feed
+from .search import SearchPaginator
+from .stats import get_stats
 
 
+@query_budget(1)
+@read_from_replica
+@cache_anonymous_page
 def index(request):
-    limit = 10
-    posts = Post.objects.all()
-    paginator = Paginator(posts, limit)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    posts = Post.objects.select_related("author")
+    paginator, page = paginate(request, posts)
     return render(
-        request, "index.html", {"page": page, "paginator": paginator}
+        request,
+        "index.html",
+        {
+            "page": page,
+            "paginator": paginator,
+            **fragment_context(request, cache.GLOBAL),
+        },
     )
 
 
+@query_budget(2)
+@read_from_replica
+@cache_anonymous_page
 def group_posts(
     request,
     slug,
 ):
-    limit = 10
     group = get_object_or_404(Group, slug=slug)
-    posts = group.group_posts.all()
-    paginator = Paginator(posts, limit)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    posts = group.group_posts.select_related("author")
+    paginator, page = paginate(request, posts)
     return render(
         request,
         "group.html",
-        {"group": group, "page": page, "paginator": paginator},
+        {
+            "group": group,
+            "page": page,
+            "paginator": paginator,
+            **fragment_context(request, cache.group(group.pk)),
+        },
+    )
+
+
+@query_budget(2)
+@read_from_replica
+def search(request):
+    query = request.GET.get("q", "").strip()
+    paginator = SearchPaginator(query, 10)
+    page = paginator.get_page(request.GET.get("cursor"))
+    return render(
+        request,
+        "search.html",
+        {"query": query, "page": page, "paginator": paginator},
     )
 
 
@@ -41,44 +82,45 @@ def new_post(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        thumbnails.schedule(post)
         return redirect("index")
     return render(request, "post_new.html", {"form": form})
 
 
+@query_budget(3)
+@read_from_replica
+@cache_anonymous_page
 def profile(request, username):
-    post_limit = 10
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(
+        with_following(User.objects.select_related("stats"), request.user),
+        username=username,
+    )
     posts = author.author_posts.all()
-    post_count = author.author_posts.count()
-    follower_count = author.following.count()
-    following_count = author.follower.count()
-    paginator = Paginator(posts, post_limit)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    paginator, page = paginate(request, posts)
     render_dict = {
         "author": author,
-        "post_count": post_count,
-        "follower_count": following_count,
-        "following_count": follower_count,
+        "stats": get_stats(author),
         "page": page,
         "paginator": paginator,
+        **fragment_context(request, cache.author(author.pk)),
     }
     if not request.user.is_anonymous:
-        following = Follow.objects.filter(
-            user=request.user, author=author
-        ).exists()
-        render_dict["following"] = following
+        render_dict["following"] = author.is_followed
+        render_dict["suggestions"] = suggestions.for_user(request.user)
 
     return render(request, "profile.html", render_dict)
 
 
+@query_budget(4)
+@read_from_replica
+@cache_anonymous_page
+@condition(etag_func=post_etag, last_modified_func=post_last_modified)
 def post_view(request, username, post_id):
-    author = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, author=author, pk=post_id)
-    post_count = author.author_posts.count()
-    follower_count = author.following.count()
-    following_count = author.follower.count()
-    comments = post.comments.all()
+    author = get_object_or_404(
+        User.objects.select_related("stats"), username=username
+    )
+    post = get_object_or_404(author.author_posts, pk=post_id)
+    cache.track(request, cache.author(author.pk), cache.post(post.pk))
     form = CommentForm()
     return render(
         request,
@@ -86,15 +128,48 @@ def post_view(request, username, post_id):
         {
             "post": post,
             "author": author,
-            "post_count": post_count,
-            "follower_count": following_count,
-            "following_count": follower_count,
+            "stats": get_stats(author),
             "form": form,
-            "comments": comments,
+            **comments_context(username, post),
         },
     )
 
 
+@query_budget(2)
+@read_from_replica
+@cache_anonymous_page
+def post_comments(request, username, post_id):
+    """Следующая порция комментариев для кнопки «Показать ещё»."""
+    post = get_object_or_404(
+        Post.objects.only("pk"), pk=post_id, author__username=username
+    )
+    cache.track(request, cache.post(post.pk))
+    return render(
+        request,
+        "includes/comment_list.html",
+        comments_context(username, post, request.GET.get("cursor")),
+    )
+
+
+def comments_context(username, post, cursor=None):
+    """
+    Порция комментариев поста по порядку создания: первая или следующая
+    за курсором, с авторами в том же запросе.
+    """
+    comments = post.comments.select_related("author")
+    paginator = CursorPaginator(
+        comments,
+        settings.COMMENTS_PER_PAGE,
+        key="created",
+        descending=False,
+    )
+    return {
+        "comments": comments,
+        "comment_page": paginator.get_page(cursor),
+        "comments_url": reverse("post_comments", args=(username, post.pk)),
+    }
+
+
 @login_required
 def post_edit(request, username, post_id):
     author = get_object_or_404(User, username=username)
@@ -108,7 +183,12 @@ def post_edit(request, username, post_id):
     )
     if request.method == "POST":
         if form.is_valid():
+            image_changed = "image" in form.changed_data
+            if image_changed:
+                post.thumbnails = ""
             form.save()
+            if image_changed:
+                thumbnails.schedule(post)
             return redirect(
                 "post_view", username=request.user.username, post_id=post_id
             )
@@ -128,13 +208,12 @@ def server_error(request):
 
 
 @login_required
+@query_budget(3)
 def add_comment(request, username, post_id):
-    author = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, pk=post_id)
-    post_count = author.author_posts.count()
-    follower_count = author.following.count()
-    following_count = author.follower.count()
-    comments = post.comments.all()
+    author = get_object_or_404(
+        User.objects.select_related("stats"), username=username
+    )
+    post = get_object_or_404(Post.objects.select_related("author"), pk=post_id)
     form = CommentForm(request.POST or None)
     if request.method == "POST":
         if form.is_valid():
@@ -151,26 +230,32 @@ def add_comment(request, username, post_id):
             "post": post,
             "author": author,
             "form": form,
-            "post_count": post_count,
-            "follower_count": following_count,
-            "following_count": follower_count,
-            "comments": comments,
+            "stats": get_stats(author),
+            **comments_context(username, post),
         },
     )
 
 
 @login_required
+@query_budget(4)
+@read_from_replica
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    # Ленту сбрасывают fan_out и bump_followers; посты авторов выше
+    # порога читаются при открытии и зависят от их областей.
+    pulled = pulled_authors(request.user)
+    paginator, page = paginate_feed(
+        request, timeline(request.user, pulled=pulled)
+    )
+    scopes = [cache.user(request.user.pk)]
+    scopes.extend(cache.author(author_id) for author_id in pulled)
     return render(
         request,
         "follow.html",
         {
             "page": page,
             "paginator": paginator,
+            "suggestions": suggestions.for_user(request.user),
+            **fragment_context(request, *scopes),
         },
     )
 
@@ -190,3 +275,22 @@ def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     Follow.objects.filter(user=user, author=author).delete()
     return redirect("profile", username=username)
+
+
+@login_required
+def profile_export(request, username):
+    """Выгрузка постов и комментариев автора в JSON Lines или CSV."""
+    author = get_object_or_404(User, username=username)
+    if request.user != author and not request.user.is_staff:
+        raise PermissionDenied
+    file_format = request.GET.get("format")
+    if file_format not in export.CONTENT_TYPES:
+        file_format = "jsonl"
+    response = StreamingHttpResponse(
+        export.lines(author, file_format),
+        content_type=export.CONTENT_TYPES[file_format],
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="{author.username}.{file_format}"'
+    )
+    return response
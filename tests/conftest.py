@@ -1,4 +1,31 @@
+import pytest
+
 pytest_plugins = [
     "tests.fixtures.fixture_user",
     "tests.fixtures.fixture_data",
 ]
+
+
+@pytest.fixture(autouse=True)
+def clear_cache(settings):
+    # Рабочий кеш лежит в файле и переживает очистку тестовой базы;
+    # тесты работают с отдельным кешем в памяти.
+    from django.core.cache import cache
+
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    # Загрузки тестов не должны оставаться в рабочем MEDIA_ROOT.
+    settings.MEDIA_ROOT = str(tmp_path / "media")
+
+
+@pytest.fixture(autouse=True)
+def thumbnails_inline(settings):
+    # Фоновый поток миниатюр пишет в ту же тестовую базу, что и запрос,
+    # и SQLite отвечает «database table is locked».
+    settings.THUMBNAIL_WORKERS = 0
@@ -0,0 +1,130 @@
+"""
+Чтение с реплик базы и постоянные соединения.
+
+Представления ленты и страницы поста читают с реплик (декоратор
+posts.decorators.read_from_replica), всё остальное и любая запись идут
+в основную базу. Запрос, который что-то записал, до конца читает из
+основной базы, а клиент получает cookie, по которой его запросы ещё
+REPLICA_PIN_SECONDS секунд не уходят на реплики: так пользователь сразу
+видит свои новые посты, даже если реплика отстаёт. Реплика выбирается
+один раз на запрос, чтобы все его чтения видели одно состояние данных.
+Страницы для общего кеша рендерятся из основной базы (primary_reads),
+а фрагменты, отрендеренные с реплики, не кешируются, пока реплика может
+не успеть за последней сменой поколения (posts.cache.track).
+
+Django 2.2 не проверяет постоянные соединения перед повторным
+использованием, поэтому роутер проверяет соединение, когда запрос
+впервые обращается к нему; базы, к которым запрос не обращался, не
+проверяются.
+"""
+
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = "use_primary"
+
+_state = threading.local()
+
+
+def replicas():
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+@contextmanager
+def replica_reads():
+    """Разрешает чтение с реплик внутри блока; реплика — одна на блок."""
+    previous = getattr(_state, "replica", None)
+    if previous is None:
+        aliases = replicas()
+        _state.replica = random.choice(aliases) if aliases else None
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+@contextmanager
+def primary_reads():
+    """Отправляет чтения блока в основную базу, даже внутри replica_reads()."""
+    previous = getattr(_state, "primary", False)
+    _state.primary = True
+    try:
+        yield
+    finally:
+        _state.primary = previous
+
+
+def reads_from_replica():
+    """Уйдёт ли чтение в текущем потоке на реплику."""
+    return (
+        getattr(_state, "replica", None) is not None
+        and not is_pinned()
+        and not getattr(_state, "primary", False)
+    )
+
+
+def set_pinned(pinned):
+    """Отправляет все чтения текущего потока в основную базу."""
+    _state.pinned = pinned
+
+
+def is_pinned():
+    return getattr(_state, "pinned", False)
+
+
+def checkout(alias):
+    """
+    При первом обращении запроса к базе закрывает её постоянное
+    соединение, если оно перестало отвечать; Django откроет новое.
+    """
+    checked = getattr(_state, "checked", None)
+    if checked is not None and alias not in checked:
+        checked.add(alias)
+        connection = connections[alias]
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
+    return alias
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if reads_from_replica():
+            return checkout(_state.replica)
+        return checkout(DEFAULT_DB_ALIAS)
+
+    def db_for_write(self, model, **hints):
+        set_pinned(True)
+        return checkout(DEFAULT_DB_ALIAS)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class DatabaseMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.checked = set() if settings.DATABASE_HEALTH_CHECKS else None
+        set_pinned(PIN_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+            if is_pinned() and PIN_COOKIE not in request.COOKIES:
+                response.set_cookie(
+                    PIN_COOKIE,
+                    "1",
+                    max_age=settings.REPLICA_PIN_SECONDS,
+                    httponly=True,
+                )
+        finally:
+            set_pinned(False)
+            _state.checked = None
+        return response
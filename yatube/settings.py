@@ -62,6 +62,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "yatube.db.DatabaseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -101,13 +102,52 @@ WSGI_APPLICATION = "yatube.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# The primary comes from DATABASE_URL, read replicas from a comma-separated
+# DATABASE_REPLICA_URLS; reads are sent to replicas only from the views
+# marked with posts.decorators.read_from_replica (see yatube.db)
 DATABASES = {
-    # 'default': env.db()
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": os.path.join(BASE_DIR, "db.sqlite3"),
+    "default": env.db(
+        "DATABASE_URL",
+        default="sqlite:///" + os.path.join(BASE_DIR, "db.sqlite3"),
+    ),
+}
+for index, url in enumerate(env.list("DATABASE_REPLICA_URLS", default=[])):
+    DATABASES[f"replica_{index}"] = {
+        **env.db_url_config(url),
+        "TEST": {"MIRROR": "default"},
     }
+
+# Opt-in profile for nodes running on SQLite (SQLITE_PRODUCTION=1): WAL lets
+# readers work during writes, synchronous=NORMAL drops the fsync on every
+# commit (still safe with WAL), mmap and a 64 MiB page cache cut read
+# syscalls, and writers queue on busy_timeout behind BEGIN IMMEDIATE
+# instead of failing with "database is locked"
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 2**20,
+    "cache_size": -64 * 2**10,
+    "busy_timeout": 5000,
 }
+if env.bool("SQLITE_PRODUCTION", default=False):
+    for database in DATABASES.values():
+        if database["ENGINE"] == "django.db.backends.sqlite3":
+            database["ENGINE"] = "yatube.sqlite3"
+            database.setdefault("OPTIONS", {}).update(
+                PRAGMAS=SQLITE_PRAGMAS, TRANSACTION_MODE="IMMEDIATE"
+            )
+
+# Connections are kept open between requests and checked when a request
+# first uses them
+for database in DATABASES.values():
+    database["CONN_MAX_AGE"] = env.int("CONN_MAX_AGE", default=60)
+DATABASE_HEALTH_CHECKS = env.bool("DATABASE_HEALTH_CHECKS", default=True)
+
+DATABASE_ROUTERS = ["yatube.db.ReplicaRouter"]
+
+# After a write the client reads from the primary for this many seconds,
+# which should cover the replication lag
+REPLICA_PIN_SECONDS = env.int("REPLICA_PIN_SECONDS", default=10)
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -166,8 +206,68 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 SITE_ID = 1
 
 # Connecting caching backend
+# One SQLite file per host: every gunicorn worker reads the same entries
+# and sees the same invalidations, unlike per-process LocMemCache
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "BACKEND": "yatube.sqlite_cache.SQLiteCache",
+        "LOCATION": os.getenv(
+            "CACHE_LOCATION", os.path.join(BASE_DIR, "cache.sqlite3")
+        ),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", 100000)),
+            "MAX_SIZE": int(os.getenv("CACHE_MAX_SIZE", 256 * 2**20)),
+        },
     }
 }
+
+# Template fragments are keyed by generation counters bumped on writes,
+# so they can live long
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Whole pages for anonymous visitors are validated against the same
+# generations; browsers revalidate them with ETag on every visit
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+PAGE_CACHE_MAX_AGE = 0
+
+# Uploaded post images are checked against POST_IMAGE_MAX_PIXELS from the
+# header, rotated by EXIF, stripped of metadata and downscaled so that the
+# longest side is at most POST_IMAGE_MASTER_SIZE
+POST_IMAGE_MAX_PIXELS = 50 * 10 ** 6
+POST_IMAGE_MASTER_SIZE = 2048
+POST_IMAGE_QUALITY = 90
+
+# Post images are cropped to THUMBNAIL_ASPECT and cut to every width in
+# every format for srcset, plus a tiny inline preview (LQIP); variants are
+# generated in the background by a pool of THUMBNAIL_WORKERS threads
+THUMBNAIL_ASPECT = (960, 339)
+THUMBNAIL_WIDTHS = (320, 640, 960)
+THUMBNAIL_FORMATS = ("WEBP", "JPEG")
+THUMBNAIL_LQIP_WIDTH = 16
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", 2))
+# Thumbnails sorl already has for posts still waiting for their variants
+# are looked up once per page and kept in a per-process LRU of this size
+THUMBNAIL_LRU_SIZE = 10000
+
+# Text search configuration used for the tsvector index on PostgreSQL
+SEARCH_CONFIG = "russian"
+
+# Comments shown on a post page and returned by each "load more" request
+COMMENTS_PER_PAGE = 20
+
+# Who-to-follow suggestions stored per user and shown in the panel;
+# a candidate scores one point per shared follow plus
+# SUGGESTION_ACTIVITY_WEIGHT * log(1 + their post count)
+SUGGESTIONS_PER_USER = 20
+SUGGESTIONS_SHOWN = 5
+SUGGESTION_ACTIVITY_WEIGHT = 0.5
+
+# Depth of the materialized follow feed kept per user
+FEED_DEPTH = 500
+# Share of inboxes trimmed back to FEED_DEPTH on each fan-out; feeds
+# overshoot the depth by about 1 / FEED_TRIM_SAMPLE rows between trims
+FEED_TRIM_SAMPLE = 0.02
+
+# Posts of authors with more followers than this are not pushed to
+# follower feeds but pulled at read time; None pushes everything
+FEED_PULL_THRESHOLD = 10000
@@ -0,0 +1,43 @@
+"""
+Бэкенд SQLite для боевых узлов: тот же django.db.backends.sqlite3, но
+каждое соединение получает PRAGMA из OPTIONS["PRAGMAS"], а транзакции
+открываются в режиме OPTIONS["TRANSACTION_MODE"].
+
+Обычный BEGIN берёт блокировку на запись только при первой записи, и
+если к этому моменту другой воркер уже записал, SQLite сразу отвечает
+«database is locked», не дожидаясь busy_timeout. BEGIN IMMEDIATE берёт
+блокировку в начале транзакции, и конкурирующие писатели ждут очереди.
+
+    DATABASES = {
+        "default": {
+            "ENGINE": "yatube.sqlite3",
+            "NAME": "/var/lib/yatube/db.sqlite3",
+            "OPTIONS": {
+                "PRAGMAS": {"journal_mode": "WAL", "busy_timeout": 5000},
+                "TRANSACTION_MODE": "IMMEDIATE",
+            },
+        }
+    }
+"""
+
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = params.pop("PRAGMAS", {})
+        self.transaction_mode = params.pop("TRANSACTION_MODE", None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode:
+            self.cursor().execute(f"BEGIN {self.transaction_mode}")
+        else:
+            super()._start_transaction_under_autocommit()
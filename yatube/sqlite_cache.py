@@ -0,0 +1,274 @@
+"""
+Кеш в локальной базе SQLite, общий для всех воркеров на одном хосте.
+
+Журнал WAL позволяет читать параллельно с записью, поэтому воркеры
+gunicorn видят записи и инвалидацию друг друга без внешнего сервиса.
+Размер кеша ограничен числом записей (MAX_ENTRIES) и объёмом значений в
+байтах (MAX_SIZE); при превышении удаляются давно не читанные записи.
+
+    CACHES = {
+        "default": {
+            "BACKEND": "yatube.sqlite_cache.SQLiteCache",
+            "LOCATION": "/var/tmp/yatube-cache.sqlite3",
+            "OPTIONS": {"MAX_ENTRIES": 100000, "MAX_SIZE": 256 * 2 ** 20},
+        }
+    }
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+"""
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        options = params.get("OPTIONS", {})
+        self._max_size = int(options.get("MAX_SIZE", 64 * 2**20))
+        # Вытеснение проверяется не на каждой записи, а раз в CULL_EVERY.
+        self._cull_every = int(options.get("CULL_EVERY", 100))
+        # Время доступа для LRU обновляется не чаще раза в секунду, чтобы
+        # чтение почти никогда не брало блокировку на запись.
+        self._touch_resolution = float(options.get("TOUCH_RESOLUTION", 1))
+        self._busy_timeout = int(options.get("BUSY_TIMEOUT", 5000))
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(
+                self._path, isolation_level=None, check_same_thread=False
+            )
+            db.execute(f"PRAGMA busy_timeout = {self._busy_timeout}")
+            db.execute("PRAGMA journal_mode = WAL")
+            db.execute("PRAGMA synchronous = NORMAL")
+            db.executescript(SCHEMA)
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _write(self, sql, params=(), many=False):
+        with self._transaction() as db:
+            if many:
+                cursor = db.executemany(sql, params)
+            else:
+                cursor = db.execute(sql, params)
+        self._after_write()
+        return cursor.rowcount
+
+    def _after_write(self):
+        self._writes += 1
+        if self._writes % self._cull_every == 0:
+            self._cull()
+
+    def _cull(self):
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+            count, size = db.execute(
+                "SELECT count(*), total(size) FROM cache"
+            ).fetchone()
+            if count > self._max_entries:
+                # Как и у встроенных бэкендов, освобождаем сразу
+                # 1/cull_frequency кеша, а не одну запись.
+                excess = count - self._max_entries
+                excess += self._max_entries // self._cull_frequency
+                db.execute(
+                    "DELETE FROM cache WHERE key IN ("
+                    "SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                    (excess,),
+                )
+            if size > self._max_size:
+                target = size - self._max_size
+                target += self._max_size // self._cull_frequency
+                db.execute(
+                    "DELETE FROM cache WHERE key IN ("
+                    "SELECT key FROM (SELECT key, size, sum(size) OVER ("
+                    "ORDER BY accessed ROWS UNBOUNDED PRECEDING) AS running "
+                    "FROM cache) WHERE running - size < ?)",
+                    (target,),
+                )
+
+    def _row(self, key, value, timeout, now):
+        data = pickle.dumps(value, self.pickle_protocol)
+        return key, data, self.get_backend_timeout(timeout), now, len(data)
+
+    def _touch_rows(self, rows, now):
+        stale = [
+            (now, key)
+            for key, accessed in rows
+            if now - accessed > self._touch_resolution
+        ]
+        if stale:
+            with self._transaction() as db:
+                db.executemany(
+                    "UPDATE cache SET accessed = ? WHERE key = ?", stale
+                )
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._get_many([key]).get(key, default)
+
+    def _get_many(self, keys):
+        now = time.time()
+        result = {}
+        touched = []
+        for start in range(0, len(keys), 500):
+            chunk = keys[start : start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = self._db.execute(
+                "SELECT key, value, expires, accessed FROM cache "
+                f"WHERE key IN ({placeholders})",
+                chunk,
+            )
+            for key, value, expires, accessed in rows:
+                if expires is not None and expires <= now:
+                    continue
+                result[key] = pickle.loads(value)
+                touched.append((key, accessed))
+        self._touch_rows(touched, now)
+        return result
+
+    def get_many(self, keys, version=None):
+        key_map = {}
+        for key in keys:
+            made = self.make_key(key, version=version)
+            self.validate_key(made)
+            key_map[made] = key
+        found = self._get_many(list(key_map))
+        return {key_map[key]: value for key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._write(
+            "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+            self._row(key, value, timeout, time.time()),
+        )
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        rows = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            rows.append(self._row(key, value, timeout, now))
+        if rows:
+            self._write(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                rows,
+                many=True,
+            )
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                "DELETE FROM cache WHERE key = ? AND expires <= ?", (key, now)
+            )
+            cursor = db.execute(
+                "INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?, ?)",
+                self._row(key, value, timeout, now),
+            )
+        self._after_write()
+        return cursor.rowcount == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return bool(
+            self._write(
+                "UPDATE cache SET expires = ? "
+                "WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                (self.get_backend_timeout(timeout), key, time.time()),
+            )
+        )
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT value FROM cache "
+                "WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                (key, now),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            data = pickle.dumps(value, self.pickle_protocol)
+            db.execute(
+                "UPDATE cache SET value = ?, size = ?, accessed = ? "
+                "WHERE key = ?",
+                (data, len(data), now, key),
+            )
+        return value
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        row = self._db.execute(
+            "SELECT 1 FROM cache "
+            "WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._write("DELETE FROM cache WHERE key = ?", (key,))
+
+    def delete_many(self, keys, version=None):
+        rows = []
+        for key in keys:
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            rows.append((key,))
+        if rows:
+            self._write("DELETE FROM cache WHERE key = ?", rows, many=True)
+
+    def clear(self):
+        self._write("DELETE FROM cache")
+
+    def close(self, **kwargs):
+        # Соединение живёт весь срок воркера, как и у LocMemCache.
+        pass